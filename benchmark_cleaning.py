@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+正文清理基准测试
+比较 parsing 中预编译的清理规则与原来逐条执行正则的实现处理 books/ 下已获取章节的耗时；
+两者结果一致由 tests/test_parsing.py 检查（原实现和检查用的文本也在其中）
+
+用法: python benchmark_cleaning.py --rounds 5
+"""
+
+import argparse
+import sys
+import time
+
+import parsing
+from tests.test_parsing import book_texts, legacy_clean_content, legacy_finish_chapter_content
+
+
+def benchmark(texts, finish, clean, rounds):
+    """返回按抓取流程（提取后清理、保存前再清理）处理全部文本 rounds 遍的耗时（秒）"""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for title, text in texts:
+            clean(finish(text, title))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较预编译清理规则与原实现的耗时')
+    parser.add_argument('--books-dir', default='books', help='已获取的markdown目录')
+    parser.add_argument('--rounds', type=int, default=5, help='处理全部章节的遍数')
+    args = parser.parse_args()
+
+    texts = book_texts(args.books_dir)
+    if not texts:
+        print(f"{args.books_dir}/ 下没有已获取的markdown")
+        return 1
+    total_chars = sum(len(text) for _, text in texts)
+    print(f"章节: {len(texts)} 个，共 {total_chars} 字")
+
+    legacy_elapsed = benchmark(texts, legacy_finish_chapter_content, legacy_clean_content, args.rounds)
+    elapsed = benchmark(texts, parsing._finish_chapter_content, parsing.clean_content, args.rounds)
+    rate = total_chars * args.rounds / 10000
+    print(f"\n{'实现':<12}{'耗时(秒)':>10}{'万字/秒':>10}{'加速':>8}")
+    print(f"{'原实现':<12}{legacy_elapsed:>10.2f}{rate / legacy_elapsed:>10.1f}{1:>7.1f}x")
+    print(f"{'预编译规则':<12}{elapsed:>10.2f}{rate / elapsed:>10.1f}{legacy_elapsed / elapsed:>7.1f}x")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTML解析后端基准测试
+先检查各解析后端（html.parser / lxml / selectolax）从相同页面提取的章节正文
+完全一致、按学到的提取策略重新提取（以及模拟流式下载提前停止后提取）的结果
+与完整探测相同，再比较各后端的解析吞吐量；另外比较按声明编码解码（parsing.decode_html）
+与BeautifulSoup编码检测（UnicodeDammit）的结果和耗时
+
+页面来源：
+  1. 响应缓存（HTTP_CACHE_DIR，默认 .cache）中保存的原始页面
+  2. 缓存为空时，用 books/ 下已获取的markdown按站点页面结构合成章节页面，
+     其中一部分没有 <article>（走内容区域选择器的回退路径），一部分在正文前有同样
+     class 的短提示，一部分在 <article> 之后内嵌了页面数据，一部分使用GB18030编码
+
+用法: python benchmark_parsers.py --rounds 3
+正文不一致时以非0状态退出
+"""
+
+import argparse
+import glob
+import gzip
+import html
+import json
+import os
+import re
+import sys
+import time
+
+from bs4 import UnicodeDammit
+
+import parsing
+
+
+def load_cached_pages(cache_dir):
+    """读取响应缓存中的原始页面，返回 [(名称, HTML字节)]"""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(cache_dir, 'bodies', '*', '*.gz'))):
+        try:
+            with gzip.open(path, 'rb') as f:
+                body = f.read()
+        except (OSError, EOFError):
+            continue
+        if b'<html' in body[:2048].lower():
+            pages.append((os.path.basename(path)[:12], body))
+    return pages
+
+
+def read_book_chapters(path):
+    """从 save_to_markdown 生成的文件中读取 [(标题, 段落列表)]"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    chapters = []
+    for section in re.split(r'^## \d+\. ', text, flags=re.MULTILINE)[1:]:
+        title, _, body = section.partition('\n')
+        # 章节格式：来源链接、分隔线、正文、分隔线
+        parts = body.split('\n---\n')
+        content = parts[1] if len(parts) > 1 else body
+        paragraphs = [line.strip() for line in content.split('\n') if line.strip()]
+        if paragraphs:
+            chapters.append((title.strip(), paragraphs))
+    return chapters
+
+
+def make_chapter_page(title, paragraphs, variant):
+    """按站点页面结构生成章节页面：导航、正文、上一章/下一篇、版权信息"""
+    body = '\n'.join(f'<p>{html.escape(paragraph)}</p>' for paragraph in paragraphs)
+    if variant == 'div':
+        # 没有 <article>，正文在内容区域中
+        main = f'<div class="chapter-reader-content"><h1>{html.escape(title)}</h1>\n{body}</div>'
+    elif variant == 'notice':
+        # 正文前有一个同样 class 的短提示，按策略提取时也要选中正文
+        main = (f'<div class="content"><p>本页说明：请登录以后阅读更多内容哦</p></div>\n'
+                f'<div class="content"><h1>{html.escape(title)}</h1>\n{body}</div>')
+    else:
+        main = f'<article><h1>{html.escape(title)}</h1>\n{body}<script>window.__reader__ = 1;</script></article>'
+
+    state = ''
+    if variant == 'payload':
+        # 页面数据嵌在 <article> 之后的 <script> 中，流式下载不能在 </article> 处停止
+        data = {'chapter': {'title': title, 'content': paragraphs}}
+        payload = json.dumps(data, ensure_ascii=False).replace('</', '<\\/')
+        state = f'<script>window._ROUTER_DATA = {payload};</script>\n'
+
+    charset = 'gb18030' if variant == 'gb18030' else 'utf-8'
+    page = f'''<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="{charset}">
+<title>{html.escape(title)} - 识典古籍</title>
+<style>.chapter-reader-content {{ font-size: 18px; }}</style>
+<script>var config = {{"book": "demo"}};</script>
+</head>
+<body>
+<header><nav><a href="/">首页</a> <a href="/library">书库</a> <span>登录后阅读更方便</span></nav></header>
+<div class="reader-layout">
+<aside class="sidebar"><a href="#">目录</a></aside>
+{main}
+<div class="reader-pager"><a href="#">上一章</a> <a href="#">下一篇</a></div>
+</div>
+<footer>识典古籍 © 北京字节跳动科技有限公司 版权所有</footer>
+{state}</body>
+</html>'''
+    return page.encode(charset)
+
+
+def synthesize_pages(books_dir):
+    """用已获取的书籍合成章节页面，返回 [(名称, HTML字节)]"""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(books_dir, '*.md'))):
+        for index, (title, paragraphs) in enumerate(read_book_chapters(path)):
+            variant = ('article', 'article', 'div', 'notice', 'payload', 'gb18030')[index % 6]
+            pages.append((f"{title}[{variant}]", make_chapter_page(title, paragraphs, variant)))
+    return pages
+
+
+def check_equivalence(pages, parsers):
+    """以 html.parser 的结果为基准，返回各后端提取结果不一致的页面数"""
+    mismatches = {}
+    baseline = [parsing.extract_chapter_content(page, name, 'html.parser') for name, page in pages]
+    for parser in parsers:
+        mismatches[parser] = 0
+        for (name, page), expected in zip(pages, baseline):
+            actual = parsing.extract_chapter_content(page, name, parser)
+            if actual != expected:
+                mismatches[parser] += 1
+                if mismatches[parser] == 1:
+                    print(f"  {parser} 与 html.parser 不一致: {name}")
+                    print(f"    期望: {expected[:80]!r}")
+                    print(f"    实际: {actual[:80]!r}")
+    return mismatches
+
+
+def benchmark_decoding(pages, rounds):
+    """比较两种解码方式，返回 (不一致的页面数, 声明编码耗时, UnicodeDammit耗时)"""
+    mismatches = sum(1 for _, page in pages
+                     if parsing.decode_html(page) != UnicodeDammit(page, is_html=True).unicode_markup)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for _, page in pages:
+            parsing.decode_html(page)
+    declared_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for _, page in pages:
+            UnicodeDammit(page, is_html=True)
+    detect_elapsed = time.perf_counter() - started
+    return mismatches, declared_elapsed, detect_elapsed
+
+
+def stream_prefix(page, strategy, use_payload=True, chunk_size=64):
+    """模拟流式下载：按块读取页面，正文容器闭合后停止，返回已读取部分解码后的字符串"""
+    detector = parsing.ContentEndDetector(strategy, use_payload)
+    for end in range(chunk_size, len(page) + chunk_size, chunk_size):
+        if detector(page[end - chunk_size:end]):
+            return parsing.decode_html(page[:end], final=False)
+    return parsing.decode_html(page)
+
+
+def check_strategies(pages, parsers):
+    """按完整探测得到的策略重新提取，返回各后端结果与完整探测不一致的页面数"""
+    mismatches = {}
+    for parser in parsers:
+        mismatches[parser] = 0
+        for name, page in pages:
+            expected, strategy = parsing.extract_with_strategy(page, name, parser)
+            actual, _ = parsing.extract_with_strategy(page, name, parser, strategy=strategy)
+            # 学习阶段（没有策略）和学到策略后的流式下载
+            for known in (None, strategy):
+                if actual == expected:
+                    actual, _ = parsing.extract_with_strategy(
+                        stream_prefix(page, known), name, parser, strategy=known)
+            if actual != expected:
+                mismatches[parser] += 1
+                if mismatches[parser] == 1:
+                    print(f"  {parser} 按策略 {strategy} 提取的结果不同: {name}")
+                    print(f"    期望: {expected[:80]!r}")
+                    print(f"    实际: {actual[:80]!r}")
+    return mismatches
+
+
+def benchmark(pages, parser, rounds):
+    """返回解析全部页面 rounds 遍的耗时（秒）"""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for name, page in pages:
+            parsing.extract_chapter_content(page, name, parser)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较各HTML解析后端的正文提取结果和吞吐量')
+    parser.add_argument('--cache-dir', default=os.getenv('HTTP_CACHE_DIR', '.cache'), help='响应缓存目录')
+    parser.add_argument('--books-dir', default='books', help='缓存为空时用于合成页面的markdown目录')
+    parser.add_argument('--rounds', type=int, default=3, help='每个后端解析全部页面的遍数')
+    args = parser.parse_args()
+
+    pages = load_cached_pages(args.cache_dir)
+    source = f"响应缓存 {args.cache_dir}"
+    if not pages:
+        pages = synthesize_pages(args.books_dir)
+        source = f"由 {args.books_dir}/ 合成"
+    if not pages:
+        print("没有可用的页面：请先获取一本书（保留响应缓存），或在 books/ 下放入已获取的markdown")
+        return 1
+
+    total_bytes = sum(len(page) for _, page in pages)
+    print(f"页面: {len(pages)} 个（{source}），共 {total_bytes / 1024 / 1024:.1f} MB")
+
+    # 只比较已安装的后端
+    parsers = [name for name in parsing.PARSERS if parsing.resolve_parser(name) == name]
+
+    print("\n正文一致性检查（以 html.parser 为基准）:")
+    mismatches = check_equivalence(pages, [name for name in parsers if name != 'html.parser'])
+    for name, count in mismatches.items():
+        print(f"  {name:<12} {'一致' if count == 0 else f'{count} 个页面不一致'}")
+
+    print("\n提取策略检查（按学到的策略提取、模拟流式下载后提取都与完整探测一致）:")
+    strategy_mismatches = check_strategies(pages, parsers)
+    for name, count in strategy_mismatches.items():
+        print(f"  {name:<12} {'一致' if count == 0 else f'{count} 个页面不一致'}")
+
+    decode_mismatches, declared_elapsed, detect_elapsed = benchmark_decoding(pages, args.rounds)
+    print(f"\n解码: 声明编码 {declared_elapsed:.3f} 秒，UnicodeDammit {detect_elapsed:.3f} 秒"
+          f"（{detect_elapsed / declared_elapsed:.1f}x），"
+          f"{'结果一致' if decode_mismatches == 0 else f'{decode_mismatches} 个页面不一致'}")
+
+    print(f"\n{'后端':<14}{'耗时(秒)':>10}{'页面/秒':>10}{'MB/秒':>8}{'加速':>8}")
+    base_elapsed = None
+    for name in parsers:
+        elapsed = benchmark(pages, name, args.rounds)
+        base_elapsed = base_elapsed or elapsed
+        rate = len(pages) * args.rounds / elapsed
+        throughput = total_bytes * args.rounds / elapsed / 1024 / 1024
+        print(f"{name:<14}{elapsed:>10.2f}{rate:>10.1f}{throughput:>8.1f}{base_elapsed / elapsed:>7.1f}x")
+
+    return 1 if any(mismatches.values()) or any(strategy_mismatches.values()) or decode_mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
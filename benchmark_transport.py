@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传输层基准测试
+在本地启动两个测试服务器（HTTP/1.1 和 明文HTTP/2），分别用 requests 传输
+和 HTTP/2 传输并发获取相同的章节页面，比较耗时和建立的连接数
+
+用法: python benchmark_transport.py --requests 400 --concurrency 16 --latency 0.05
+HTTP/2 部分需要安装 httpx[http2]
+"""
+
+import argparse
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 基准测试不需要限速、缓存和去重，在导入获取器之前关闭
+os.environ.update({
+    'REQUEST_DELAY': '0',
+    'HTTP_CACHE': '0',
+    'REQUEST_MEMO': '0',
+    'OUTPUT_DIR': tempfile.gettempdir(),
+})
+
+from fetch_book import ShidiangujiFetcher
+from transports import Http2Transport
+
+
+def make_page(index, size):
+    """生成一个大约 size 字节的章节页面"""
+    paragraph = f'<p>皇极经世卷第{index} 以元经会 以会经运 以运经世 观物内篇</p>'
+    count = max(1, size // len(paragraph.encode('utf-8')))
+    return (f'<html><head><meta charset="utf-8"><title>第{index}章</title></head>'
+            f'<body><article>{paragraph * count}</article></body></html>').encode('utf-8')
+
+
+class Http1Server:
+    """HTTP/1.1 keep-alive 测试服务器"""
+
+    def __init__(self, latency, size):
+        self.connections = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                server.connections += 1
+                super().setup()
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                time.sleep(latency)
+                body = make_page(self.path.rsplit('/', 1)[-1], size)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+class H2cServer:
+    """明文HTTP/2（prior knowledge）测试服务器，基于 h2 库实现，处理流控"""
+
+    def __init__(self, latency, size):
+        import h2.config
+        import h2.connection
+        import h2.events
+
+        self._h2 = h2
+        self.latency = latency
+        self.size = size
+        self.connections = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(64)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        h2 = self._h2
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        lock = threading.Lock()
+        pending = {}
+
+        def flush():
+            # 按流控窗口发送尚未发完的响应体（调用方需持有锁）
+            for stream_id in list(pending):
+                data = pending[stream_id]
+                while data:
+                    window = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+                    if window <= 0:
+                        break
+                    conn.send_data(stream_id, data[:window])
+                    data = data[window:]
+                if data:
+                    pending[stream_id] = data
+                else:
+                    conn.end_stream(stream_id)
+                    del pending[stream_id]
+            client.sendall(conn.data_to_send())
+
+        def respond(stream_id, path):
+            body = make_page(path.rsplit('/', 1)[-1], self.size)
+            with lock:
+                conn.send_headers(stream_id, [
+                    (':status', '200'),
+                    ('content-type', 'text/html; charset=utf-8'),
+                    ('content-length', str(len(body))),
+                ])
+                pending[stream_id] = body
+                flush()
+
+        with lock:
+            conn.initiate_connection()
+            client.sendall(conn.data_to_send())
+
+        while True:
+            try:
+                data = client.recv(65535)
+            except OSError:
+                break
+            if not data:
+                break
+            with lock:
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        path = dict(event.headers)[b':path'].decode()
+                        # 模拟服务器处理耗时，不阻塞同一连接上的其他流
+                        threading.Timer(self.latency, respond, args=(event.stream_id, path)).start()
+                flush()
+        client.close()
+
+    def close(self):
+        self.sock.close()
+
+
+def run_benchmark(base_url, total, concurrency, transport=None):
+    """用获取器的下载路径并发获取 total 个页面，返回耗时（秒）"""
+    fetcher = ShidiangujiFetcher()
+    if transport is not None:
+        fetcher.transport = transport
+    urls = [f"{base_url}/book/BENCH/chapter/{i}" for i in range(total)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        sizes = list(executor.map(lambda url: len(fetcher._download_chapter(url)), urls))
+    elapsed = time.perf_counter() - started
+
+    assert len(sizes) == total and all(sizes)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较 requests 与 HTTP/2 传输的章节获取性能')
+    parser.add_argument('--requests', type=int, default=400, help='请求的页面数')
+    parser.add_argument('--concurrency', type=int, default=16, help='并发数')
+    parser.add_argument('--latency', type=float, default=0.05, help='服务器模拟处理耗时（秒）')
+    parser.add_argument('--size', type=int, default=20000, help='页面大小（字节）')
+    args = parser.parse_args()
+
+    print(f"页面数: {args.requests}，并发数: {args.concurrency}，"
+          f"服务器耗时: {args.latency} 秒，页面大小: {args.size} 字节")
+
+    # 连接池大小与并发数一致，与 FETCH_CONCURRENCY 的实际效果相同
+    os.environ['FETCH_CONCURRENCY'] = str(args.concurrency)
+    results = []
+
+    http1 = Http1Server(args.latency, args.size)
+    elapsed = run_benchmark(f"http://127.0.0.1:{http1.port}", args.requests, args.concurrency)
+    results.append(('requests (HTTP/1.1)', elapsed, http1.connections))
+    http1.close()
+
+    try:
+        h2c = H2cServer(args.latency, args.size)
+        transport = Http2Transport(max_connections=args.concurrency, http1=False)
+    except ImportError as e:
+        print(f"跳过HTTP/2: {e}")
+    else:
+        elapsed = run_benchmark(f"http://127.0.0.1:{h2c.port}", args.requests, args.concurrency, transport)
+        results.append(('http2 (httpx)', elapsed, h2c.connections))
+        transport.close()
+        h2c.close()
+
+    print(f"\n{'传输':<22}{'耗时(秒)':>10}{'请求/秒':>10}{'连接数':>8}")
+    for name, elapsed, connections in results:
+        print(f"{name:<22}{elapsed:>10.2f}{args.requests / elapsed:>10.1f}{connections:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+章节存储
+记录已完成章节的断点日志，中断后可以从日志继续获取；
+ChapterStore 在内存中保存已完成的章节，超出内存上限的章节写入临时文件
+"""
+
+import json
+import os
+import tempfile
+import threading
+
+
+class ChapterJournal:
+    """只追加的章节断点日志
+
+    每完成一个章节就以JSON行的形式追加写入并立即刷新到磁盘，
+    进程崩溃或被中断时最多丢失正在写入的那一行。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def iter_chapters(self):
+        """逐行读取日志中已完成的章节，不把整个日志读入内存"""
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    chapter = json.loads(line)
+                except json.JSONDecodeError:
+                    # 中断时写了一半的行，忽略即可
+                    continue
+                yield chapter
+
+    def reset(self):
+        """清空日志，开始新的获取"""
+        with self._lock:
+            self._close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def append(self, chapter_data):
+        """追加一个已完成的章节"""
+        line = json.dumps(chapter_data, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+
+    def remove(self):
+        """书籍完整保存后删除日志"""
+        self.reset()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ChapterStore:
+    """已完成章节的存储，内存占用有上限
+
+    章节正文累计不超过 max_bytes 时保存在内存中，超出后的章节以JSON行
+    追加到临时文件，只在内存中保留文件偏移；max_bytes 为0表示不限制。
+    临时文件在 close() 时删除。
+    """
+
+    def __init__(self, max_bytes=0, spill_dir=None):
+        self.max_bytes = max(0, int(max_bytes))
+        self.spill_dir = spill_dir
+        self.memory_bytes = 0
+        self.spilled = 0
+        self._memory = {}
+        self._offsets = {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    def put(self, chapter_data):
+        """保存一个已完成的章节，同一URL以最后一次为准"""
+        url = chapter_data['url']
+        size = len(chapter_data.get('content', '').encode('utf-8'))
+        with self._lock:
+            self._discard(url)
+            if not self.max_bytes or self.memory_bytes + size <= self.max_bytes:
+                self._memory[url] = (chapter_data, size)
+                self.memory_bytes += size
+                return
+
+            if self._file is None:
+                if self.spill_dir:
+                    os.makedirs(self.spill_dir, exist_ok=True)
+                self._file = tempfile.TemporaryFile(prefix='chapters_', suffix='.jsonl', dir=self.spill_dir)
+            line = (json.dumps(chapter_data, ensure_ascii=False) + '\n').encode('utf-8')
+            self._file.seek(0, os.SEEK_END)
+            self._offsets[url] = (self._file.tell(), len(line))
+            self._file.write(line)
+            self.spilled += 1
+
+    def get(self, url):
+        """读取章节，不存在时返回None"""
+        with self._lock:
+            if url in self._memory:
+                return self._memory[url][0]
+            if url not in self._offsets:
+                return None
+            offset, length = self._offsets[url]
+            self._file.seek(offset)
+            line = self._file.read(length)
+        return json.loads(line.decode('utf-8'))
+
+    def __contains__(self, url):
+        with self._lock:
+            return url in self._memory or url in self._offsets
+
+    def __len__(self):
+        with self._lock:
+            return len(self._memory) + len(self._offsets)
+
+    def ordered(self, urls):
+        """按给定的URL顺序逐个读取章节的可迭代视图，跳过不存在的章节"""
+        return OrderedChapters(self, [url for url in urls if url in self])
+
+    def close(self):
+        """删除临时文件，释放内存中的章节"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._memory.clear()
+            self._offsets.clear()
+            self.memory_bytes = 0
+
+    def _discard(self, url):
+        """移除已有的同一章节（调用方需持有锁），临时文件中的旧数据不回收"""
+        if url in self._memory:
+            self.memory_bytes -= self._memory.pop(url)[1]
+        self._offsets.pop(url, None)
+
+
+class OrderedChapters:
+    """按目录顺序流式读取章节，支持 len() 和多次迭代，不会一次性加载所有章节"""
+
+    def __init__(self, store, urls):
+        self.store = store
+        self.urls = urls
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __iter__(self):
+        for url in self.urls:
+            yield self.store.get(url)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应并发控制
+按AIMD（加性增、乘性减）规则根据响应延迟和错误动态调整并发窗口
+"""
+
+import threading
+from collections import deque
+
+
+class AIMDController:
+    """AIMD并发窗口
+
+    每完成一个窗口的请求且 p95 延迟未超过 latency_target、没有出错时，
+    窗口加 increase；遇到 429/5xx、网络错误或 p95 延迟超标时窗口乘以 decrease。
+    每个窗口最多缩减一次，避免同一批并发请求的错误把窗口连续压到最小；
+    窗口增大后的第一个错误说明加过了头，立即缩减。
+    """
+
+    # 至少积累这么多样本才根据 p95 判断延迟是否超标
+    MIN_LATENCY_SAMPLES = 5
+
+    def __init__(self, initial, minimum=1, maximum=32, latency_target=3.0,
+                 increase=1, decrease=0.5, sample_size=50):
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self.window = min(self.maximum, max(self.minimum, int(initial)))
+        self.latency_target = float(latency_target)
+        self.increase = max(1, int(increase))
+        self.decrease = float(decrease)
+
+        self.increases = 0
+        self.decreases = 0
+        self.peak = self.window
+        self._latencies = deque(maxlen=max(1, int(sample_size)))
+        self._active = 0
+        self._since_change = 0
+        # 上次缩减以来的请求数，以及其间是否增大过窗口
+        self._since_decrease = 0
+        self._grown = False
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """占用一个并发槽位，窗口已满时阻塞"""
+        with self._condition:
+            while self._active >= self.window:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    def p95(self):
+        """最近请求的 p95 延迟（秒）"""
+        with self._condition:
+            return self._p95()
+
+    def _p95(self):
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def record(self, latency, success):
+        """记录一次请求的延迟和结果（success=False 表示 429/5xx 或网络错误）"""
+        with self._condition:
+            self._latencies.append(latency)
+            self._since_change += 1
+            self._since_decrease += 1
+
+            slow = (len(self._latencies) >= self.MIN_LATENCY_SAMPLES
+                    and self._p95() > self.latency_target)
+            if not success or slow:
+                # 同一窗口内只缩减一次，增大窗口后的错误立即缩减
+                if self._grown or self._since_decrease >= self.window or self.decreases == 0:
+                    self._resize(max(self.minimum, int(self.window * self.decrease)))
+                    self.decreases += 1
+                    self._since_decrease = 0
+                    self._grown = False
+                    # 缩减后重新统计延迟，避免旧样本导致连续缩减
+                    self._latencies.clear()
+                return
+
+            if self._since_change >= self.window and self.window < self.maximum:
+                self._resize(min(self.maximum, self.window + self.increase))
+                self.increases += 1
+                self._grown = True
+
+    def _resize(self, window):
+        """调整窗口（调用方需持有锁）"""
+        self.window = window
+        self.peak = max(self.peak, window)
+        self._since_change = 0
+        self._condition.notify_all()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+页面内嵌数据提取
+前端渲染的章节页面通常把页面数据以JSON形式嵌在 <script> 中
+（__NEXT_DATA__、window.__INITIAL_STATE__、window._ROUTER_DATA 等），
+直接解析这段JSON即可得到章节正文，不需要为页面构建DOM树；
+页面没有内嵌数据或其中找不到正文时返回None。找到的文字是否真是章节正文
+由调用方与DOM正文比较后决定（见 parsing._probe_strategies）
+"""
+
+import json
+import re
+from html.parser import HTMLParser
+
+# 安装了 orjson 时用它解析JSON，速度快数倍
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+SCRIPT_PATTERN = re.compile(r'<script\b([^>]*)>(.*?)</script\s*>', re.IGNORECASE | re.DOTALL)
+# 只解析页面数据；application/ld+json 是给搜索引擎的元数据（简介等），不含正文
+JSON_SCRIPT_TYPE = re.compile(r'type\s*=\s*["\']application/json', re.IGNORECASE)
+# window.__INITIAL_STATE__ = {...} / var __NUXT__ = {...} 一类的赋值语句
+ASSIGNMENT_PATTERN = re.compile(r'\s*(?:window\.|self\.|var\s+|let\s+|const\s+)?[A-Za-z_$][\w$.]*\s*=\s*(?=[\[{])')
+HTML_TAG = re.compile(r'<[a-zA-Z/][^>]*>')
+CJK_CHAR = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+
+# 可能保存正文的字段名（不区分大小写）
+CONTENT_KEYS = ('content', 'chaptercontent', 'contenthtml', 'html', 'text', 'body', 'paragraphs')
+# 正文至少包含这么多个汉字，避免把按钮文字等短字符串当成正文
+MIN_CJK_CHARS = 10
+
+
+def iter_payloads(html):
+    """依次返回页面 <script> 中可以解析的JSON数据"""
+    decoder = json.JSONDecoder()
+    for match in SCRIPT_PATTERN.finditer(html):
+        attrs, body = match.group(1), match.group(2)
+        if JSON_SCRIPT_TYPE.search(attrs):
+            try:
+                yield _loads(body)
+            except ValueError:
+                pass
+            continue
+
+        assignment = ASSIGNMENT_PATTERN.match(body)
+        if not assignment:
+            continue
+        rest = body[assignment.end():]
+        try:
+            yield _loads(rest.rstrip().rstrip(';'))
+        except ValueError:
+            # 赋值后面还有其他语句时只解析第一个JSON值
+            try:
+                yield decoder.raw_decode(rest)[0]
+            except ValueError:
+                pass
+
+
+def _candidate_text(value):
+    """字段值转换为候选正文：字符串、字符串列表，或每项带正文字段的对象列表"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list) and value:
+        parts = []
+        for item in value:
+            if isinstance(item, str):
+                parts.append(item)
+            elif isinstance(item, dict):
+                text = next((item[key] for key in item
+                             if key.lower() in CONTENT_KEYS and isinstance(item[key], str)), None)
+                if text is None:
+                    return None
+                parts.append(text)
+            else:
+                return None
+        return '\n'.join(parts)
+    return None
+
+
+def find_chapter_text(data):
+    """在JSON数据中查找汉字最多的正文字段，找不到时返回None"""
+    best, best_score = None, MIN_CJK_CHARS - 1
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            items = node.items()
+        elif isinstance(node, list):
+            items = ((None, value) for value in node)
+        else:
+            continue
+
+        for key, value in items:
+            if key is not None and key.lower() in CONTENT_KEYS:
+                text = _candidate_text(value)
+                if text is not None:
+                    score = len(CJK_CHAR.findall(text))
+                    if score > best_score:
+                        best, best_score = text, score
+            if isinstance(value, (dict, list)):
+                stack.append(value)
+    return best
+
+
+class _TextCollector(HTMLParser):
+    """把正文字段中的HTML片段转换为逐行文本，不包括脚本和样式"""
+
+    SKIP_TAGS = ('script', 'style')
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        text = data.strip()
+        if text and not self._skip:
+            self.lines.append(text)
+
+
+def html_fragment_text(fragment):
+    """HTML片段转换为每个文本节点一行的纯文本"""
+    collector = _TextCollector()
+    collector.feed(fragment)
+    collector.close()
+    return '\n'.join(collector.lines)
+
+
+def extract_payload_text(html):
+    """从页面内嵌数据中提取章节正文（已解码的HTML字符串），找不到时返回None"""
+    best, best_score = None, 0
+    for data in iter_payloads(html):
+        text = find_chapter_text(data)
+        if text is not None:
+            score = len(CJK_CHAR.findall(text))
+            if score > best_score:
+                best, best_score = text, score
+
+    if best is None:
+        return None
+    if HTML_TAG.search(best):
+        best = html_fragment_text(best)
+    return best
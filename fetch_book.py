@@ -5,14 +5,29 @@
 支持从.env文件读取配置，批量获取古籍内容
 """
 
+import asyncio
 import requests
 import time
 import re
 import os
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urljoin, urlparse
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from contextlib import nullcontext
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from rate_limiter import TokenBucket, SharedTokenBucket
+from resilience import RetryPolicy, CircuitBreaker, DeadlineExceeded, LatencyTracker
+from http_cache import ResponseCache, RequestMemo
+from chapter_store import ChapterJournal, ChapterStore
+from pipeline import Pipeline
+from transports import create_transport, accept_encoding, read_streaming, TransferStats
+from utils import format_file_size
+from concurrency import AIMDController
+from strategy_cache import StrategyCache, describe as describe_strategy
+import parsing
 
 class ShidiangujiFetcher:
     def __init__(self):
@@ -23,15 +38,271 @@ class ShidiangujiFetcher:
         self.book_id = os.getenv('BOOK_ID', '')
         self.book_url = os.getenv('BOOK_URL', '')
         self.output_dir = os.getenv('OUTPUT_DIR', 'output')
-        self.delay = int(os.getenv('REQUEST_DELAY', '1'))
+        self.delay = float(os.getenv('REQUEST_DELAY', '1'))
+        # 获取模式: serial(逐章串行，默认) / async(asyncio并发) / thread(线程池并发)
+        #          / pipeline(下载、解析、清理、写入分阶段流水线)
+        self.fetch_mode = os.getenv('FETCH_MODE', 'serial').strip().lower()
+        self.concurrency = max(1, int(os.getenv('FETCH_CONCURRENCY', '4')))
+        # 自适应并发：以 FETCH_CONCURRENCY 为初始窗口，根据延迟和错误在
+        # [1, ADAPTIVE_MAX_CONCURRENCY] 之间按AIMD规则调整，工作线程按上限创建
+        if os.getenv('ADAPTIVE_CONCURRENCY', '0') == '1':
+            self.concurrency_controller = AIMDController(
+                initial=self.concurrency,
+                maximum=int(os.getenv('ADAPTIVE_MAX_CONCURRENCY', '16')),
+                latency_target=float(os.getenv('ADAPTIVE_LATENCY_TARGET', '3'))
+            )
+            self.workers = self.concurrency_controller.maximum
+        else:
+            self.concurrency_controller = None
+            self.workers = self.concurrency
+        self.queue_size = max(1, int(os.getenv('PIPELINE_QUEUE_SIZE', '8')))
+        # 解析/清理进程数，0表示在当前进程中解析
+        self.parse_workers = max(0, int(os.getenv('PARSE_WORKERS', '0')))
+        self.parse_pool = None
+        # 页面内嵌的JSON数据（SSR状态）中有与DOM正文长度相当的正文时从中提取
+        self.use_payload = os.getenv('EMBEDDED_PAYLOAD', '1') == '1'
+        # 流式解析：章节页面边下载边解析，<article> 闭合后不再读取页脚和脚本
+        self.stream_parse = os.getenv('STREAM_PARSE', '0') == '1'
+        self.max_page_bytes = int(float(os.getenv('MAX_PAGE_MB', '20')) * 1024 * 1024)
+        self.stream_stopped = 0
+        # 记住每本书有效的正文提取策略，保存在缓存目录中
+        self.learn_strategy = os.getenv('LEARN_STRATEGY', '1') == '1'
+        self.strategy_cache = None
+        # 章节发现时各页面的章节链接记录，同一页面只解析一次
+        self._page_links = {}
+        # HTML解析后端：html.parser(默认) / lxml / selectolax，依赖缺失时自动回退
+        self.html_parser = parsing.resolve_parser(os.getenv('HTML_PARSER', 'html.parser'))
         
         self.session = requests.Session()
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            # 明确声明可解码的压缩格式（安装 brotli 时包括 br），减少传输流量
+            'Accept-Encoding': accept_encoding()
         })
+        # 所有请求都发往同一站点，连接池大小与并发数一致，
+        # 让每个工作线程都能复用自己的keep-alive连接
+        # 对冲请求会让同时在途的请求最多翻倍
+        pool_size = self.workers * 2 if os.getenv('HEDGE_REQUESTS', '0') == '1' else self.workers
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # 传输层：requests(默认，HTTP/1.1连接池) / http2(httpx多路复用，需要安装 httpx[http2])
+        self.transport = create_transport(os.getenv('HTTP_TRANSPORT', 'requests').strip().lower(),
+                                          self.session, pool_size)
+        # 传输字节统计：网络字节（压缩后）与解码后字节
+        self.transfer_stats = TransferStats()
+        
+        # 令牌桶限速：RATE_LIMIT_RPS 未配置时按 REQUEST_DELAY 换算
+        rate = os.getenv('RATE_LIMIT_RPS', '')
+        burst = float(os.getenv('RATE_LIMIT_BURST', '1'))
+        if rate:
+            self.rate_limiter = TokenBucket(float(rate), burst)
+        else:
+            self.rate_limiter = TokenBucket.from_delay(self.delay, burst)
+        
+        # 跨进程共享的请求预算：同一台机器上所有获取进程共同遵守的总速率
+        shared_rate = os.getenv('SHARED_RATE_LIMIT_RPS', '')
+        if shared_rate:
+            self.shared_rate_limiter = SharedTokenBucket(
+                float(shared_rate),
+                float(os.getenv('SHARED_RATE_LIMIT_BURST', '1')),
+                os.getenv('SHARED_RATE_LIMIT_FILE') or None
+            )
+        else:
+            self.shared_rate_limiter = None
+        
+        # 请求超时（秒）：连接超时和读取超时，避免卡住的连接让整个运行挂起
+        self.connect_timeout = float(os.getenv('REQUEST_CONNECT_TIMEOUT', '10'))
+        self.read_timeout = float(os.getenv('REQUEST_READ_TIMEOUT', '30'))
+        # 整个运行的截止时间（秒，0表示不限制），到期后不再获取新章节
+        self.run_deadline = float(os.getenv('RUN_DEADLINE', '0'))
+        self._deadline = None
+        self.deadline_skipped = 0
+        
+        # 对冲请求：章节请求耗时超过p95时再发一个相同请求，先返回的生效
+        self.hedge_requests = os.getenv('HEDGE_REQUESTS', '0') == '1'
+        self.latency_tracker = LatencyTracker()
+        self.hedged = 0
+        self._stats_lock = threading.Lock()
+        self.hedge_pool = None
+        
+        # 重试与熔断
+        self.retry_policy = RetryPolicy(
+            max_retries=int(os.getenv('MAX_RETRIES', '3')),
+            backoff_base=float(os.getenv('RETRY_BACKOFF_BASE', '1')),
+            backoff_max=float(os.getenv('RETRY_BACKOFF_MAX', '60'))
+        )
+        self.circuit_breaker = CircuitBreaker(
+            window=int(os.getenv('CIRCUIT_WINDOW', '20')),
+            error_threshold=float(os.getenv('CIRCUIT_ERROR_THRESHOLD', '0.5')),
+            cooldown=float(os.getenv('CIRCUIT_COOLDOWN', '60'))
+        )
+        # 原始响应缓存：保存页面原文和 ETag / Last-Modified，
+        # 重复获取时发送条件请求，离线模式(OFFLINE=1)下完全从缓存回放
+        self.cache_dir = os.getenv('HTTP_CACHE_DIR', '.cache')
+        self.offline = os.getenv('OFFLINE', '0') == '1'
+        self.revalidate = os.getenv('HTTP_REVALIDATE', '1') == '1'
+        if os.getenv('HTTP_CACHE', '1') == '1' or self.offline:
+            max_bytes = int(float(os.getenv('HTTP_CACHE_MAX_MB', '512')) * 1024 * 1024)
+            self.response_cache = ResponseCache(self.cache_dir, max_bytes)
+        else:
+            self.response_cache = None
+        
+        # 同一次运行中相同URL只请求一次（包括并发中的相同请求）
+        if os.getenv('REQUEST_MEMO', '1') == '1':
+            self.request_memo = RequestMemo()
+        else:
+            self.request_memo = None
+        
+        # 断点日志：记录已完成的章节，RESUME=1 时跳过日志中已有的章节
+        self.resume = os.getenv('RESUME', '0') == '1'
+        self.journal = None
+        # 内存上限（MB，0表示不限制）：已完成章节的正文超过上限后写入临时文件，
+        # 保存时按目录顺序从临时文件流式读取
+        self.memory_limit = int(float(os.getenv('MEMORY_LIMIT_MB', '0')) * 1024 * 1024)
+        self.chapter_store = None
+        
+        # 重试后仍然失败的章节，便于结束时提示
+        self.failed_chapters = []
         
         # 创建输出目录
         os.makedirs(self.output_dir, exist_ok=True)
+    
+    def _get(self, url, release=False, hedge=False, **kwargs):
+        """所有HTTP请求的统一入口
+        
+        同一次运行中相同URL的请求只发出一次；release=True 表示之后不会
+        再请求该URL，返回后释放记住的响应；hedge=True 时启用对冲请求。
+        """
+        send = self._hedged_request if hedge and self.hedge_requests else self._request
+        if self.request_memo is None or kwargs:
+            return send(url, **kwargs)
+        return self.request_memo.get(url, send, release)
+    
+    def _hedged_request(self, url, **kwargs):
+        """对冲请求：耗时超过最近章节请求的p95时再发一个相同请求，先返回的结果生效
+        
+        落后的请求无法取消，会在后台完成后被丢弃；两个请求都会经过限速器。
+        """
+        def timed_request():
+            started = time.monotonic()
+            response = self._request(url, **kwargs)
+            self.latency_tracker.record(time.monotonic() - started)
+            return response
+        
+        hedge_after = self.latency_tracker.percentile(0.95)
+        if hedge_after is None or self.hedge_pool is None:
+            return timed_request()
+        
+        primary = self.hedge_pool.submit(timed_request)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+        
+        with self._stats_lock:
+            self.hedged += 1
+        backup = self.hedge_pool.submit(timed_request)
+        done, pending = wait([primary, backup], return_when=FIRST_COMPLETED)
+        winner = done.pop()
+        if winner.exception() is not None and pending:
+            # 先完成的请求失败了，以另一个请求的结果为准
+            winner = pending.pop()
+        return winner.result()
+    
+    def _request(self, url, **kwargs):
+        """发出请求（含重试）
+        
+        发出请求前等待熔断恢复并从限速器（以及跨进程共享预算）获取令牌；网络异常和
+        429/5xx 响应按重试策略退避重试，重试耗尽后抛出异常或返回最后的响应。
+        """
+        if self.offline:
+            return self.response_cache.replay(url)
+        
+        attempt = 0
+        while True:
+            self.circuit_breaker.wait_if_open()
+            self.rate_limiter.acquire()
+            if self.shared_rate_limiter:
+                self.shared_rate_limiter.acquire()
+            timeout = self._attempt_timeout()
+            
+            response = None
+            started = time.monotonic()
+            try:
+                response = self._send(url, timeout=timeout, **kwargs)
+            except requests.RequestException as e:
+                error = e
+            else:
+                if not self.retry_policy.is_retryable(response):
+                    self.circuit_breaker.record(True)
+                    self._record_latency(started, True)
+                    return response
+                error = f"HTTP {response.status_code}"
+            
+            self.circuit_breaker.record(False)
+            self._record_latency(started, False)
+            if attempt >= self.retry_policy.max_retries:
+                if response is not None:
+                    return response
+                raise error
+            if response is not None:
+                # 流式响应未读取的内容不再需要，释放连接
+                response.close()
+            
+            delay = self.retry_policy.delay(attempt, response)
+            remaining = self._deadline_remaining()
+            if remaining is not None and delay >= remaining:
+                raise DeadlineExceeded(f"等待重试会超过运行截止时间: {url}")
+            attempt += 1
+            print(f"  请求失败({error})，{delay:.1f} 秒后第 {attempt} 次重试: {url}")
+            time.sleep(delay)
+    
+    def _deadline_remaining(self):
+        """距离运行截止时间的剩余秒数，未设置截止时间时返回None"""
+        if self._deadline is None:
+            return None
+        return self._deadline - time.monotonic()
+    
+    def _attempt_timeout(self):
+        """本次请求的 (连接超时, 读取超时)，读取超时不超过运行剩余时间"""
+        remaining = self._deadline_remaining()
+        if remaining is None:
+            return (self.connect_timeout, self.read_timeout)
+        if remaining <= 0:
+            raise DeadlineExceeded("已超过运行截止时间")
+        return (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+    
+    def _record_latency(self, started, success):
+        """把请求耗时和结果反馈给自适应并发控制器"""
+        if self.concurrency_controller:
+            self.concurrency_controller.record(time.monotonic() - started, success)
+    
+    def _send(self, url, **kwargs):
+        """发送单个请求，有缓存记录时附带条件请求头，304时返回缓存内容"""
+        if kwargs.get('stream'):
+            # 流式读取由调用方完成并统计字节数，不写入缓存
+            return self.transport.get(url, **kwargs)
+        
+        if self.response_cache is None:
+            response = self.transport.get(url, **kwargs)
+            self.transfer_stats.record(response)
+            return response
+        
+        entry = self.response_cache.lookup(url) if self.revalidate else None
+        if entry:
+            headers = dict(kwargs.pop('headers', None) or {})
+            headers.update(self.response_cache.conditional_headers(entry))
+            kwargs['headers'] = headers
+        
+        response = self.transport.get(url, **kwargs)
+        self.transfer_stats.record(response)
+        if response.status_code == 304 and entry:
+            cached = self.response_cache.revalidate(entry)
+            cached.wire_bytes = response.wire_bytes
+            return cached
+        
+        self.response_cache.store(url, response)
+        return response
         
     def extract_book_id_from_url(self, url):
         """从URL中提取书籍ID"""
@@ -59,20 +330,16 @@ class ShidiangujiFetcher:
         book_url = f"{self.base_url}/book/{self.book_id}"
         
         try:
-            response = self.session.get(book_url)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
+            records = self._page_chapter_links(book_url)
             
             # 查找章节链接
             chapter_links = []
             
             # 方法1: 查找所有包含chapter的链接（支持多级目录）
-            all_links = soup.find_all('a', href=True)
-            for link in all_links:
-                href = link.get('href')
-                if '/chapter/' in href and self.book_id in href:
-                    title = link.get_text(strip=True)
+            for record in records:
+                href = record['url']
+                if self.book_id in href:
+                    title = record['title']
                     if title and len(title) > 1:  # 过滤掉空标题或单字符
                         chapter_links.append({
                             'url': f"{self.base_url}{href}",
@@ -82,7 +349,7 @@ class ShidiangujiFetcher:
             # 方法2: 尝试API接口
             api_url = f"{self.base_url}/api/book/{self.book_id}/chapters"
             try:
-                api_response = self.session.get(api_url)
+                api_response = self._get(api_url)
                 if api_response.status_code == 200:
                     data = api_response.json()
                     print(f"API返回数据: {json.dumps(data, ensure_ascii=False, indent=2)}")
@@ -99,23 +366,20 @@ class ShidiangujiFetcher:
             # 方法3: 尝试获取目录页面
             toc_url = f"{self.base_url}/book/{self.book_id}/toc"
             try:
-                toc_response = self.session.get(toc_url)
+                toc_response = self._get(toc_url)
                 if toc_response.status_code == 200:
-                    toc_soup = BeautifulSoup(toc_response.content, 'html.parser')
-                    # 查找可能包含章节的容器
-                    chapter_containers = toc_soup.find_all(['div', 'nav', 'ul'], class_=lambda x: x and ('chapter' in x or 'toc' in x or 'menu' in x))
-                    
-                    for container in chapter_containers:
-                        links = container.find_all('a', href=True)
-                        for link in links:
-                            href = link.get('href')
-                            if '/chapter/' in href and self.book_id in href:
-                                title = link.get_text(strip=True)
-                                if title and len(title) > 1:
-                                    chapter_links.append({
-                                        'url': f"{self.base_url}{href}",
-                                        'title': title
-                                    })
+                    # 只保留位于可能包含章节的容器中的链接
+                    for record in parsing.extract_chapter_links(self._response_text(toc_response)):
+                        if not parsing.in_container(record, ('div', 'nav', 'ul'), parsing.is_toc_container_class):
+                            continue
+                        href = record['url']
+                        if self.book_id in href:
+                            title = record['title']
+                            if title and len(title) > 1:
+                                chapter_links.append({
+                                    'url': f"{self.base_url}{href}",
+                                    'title': title
+                                })
             except Exception as e:
                 print(f"目录页面请求失败: {e}")
             
@@ -140,6 +404,14 @@ class ShidiangujiFetcher:
             print(f"分析书籍结构失败: {e}")
             return []
     
+    def _page_chapter_links(self, url):
+        """获取页面并单遍提取其中的章节链接记录，同一页面只解析一次"""
+        if url not in self._page_links:
+            response = self._get(url)
+            response.raise_for_status()
+            self._page_links[url] = parsing.extract_chapter_links(self._response_text(response))
+        return self._page_links[url]
+    
     def _discover_nested_chapters(self, initial_chapters):
         """发现二级目录结构"""
         nested_chapters = []
@@ -151,17 +423,12 @@ class ShidiangujiFetcher:
         try:
             # 访问书籍主页
             book_url = f"{self.base_url}/book/{self.book_id}"
-            response = self.session.get(book_url)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
             
             # 查找所有章节链接
-            all_links = soup.find_all('a', href=True)
-            for link in all_links:
-                href = link.get('href')
-                if '/chapter/' in href and self.book_id in href:
-                    title = link.get_text(strip=True)
+            for record in self._page_chapter_links(book_url):
+                href = record['url']
+                if self.book_id in href:
+                    title = record['title']
                     # 过滤有效的章节标题
                     if (title and len(title) > 2 and  # 至少3个字符
                         title not in seen_titles and
@@ -198,37 +465,24 @@ class ShidiangujiFetcher:
             
             try:
                 # 检查章节页面是否包含二级目录
-                response = self.session.get(chapter['url'])
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # 查找页面中的侧边栏导航（基于实际HTML结构）
-                sidebar_elements = soup.find_all(['aside', 'nav', 'div'], 
-                    class_=lambda x: x and any(keyword in x.lower() for keyword in 
-                    ['sidebar', 'nav', 'menu', 'chapter', '目录', '导航']))
-                
-                # 在章节页面中查找额外的链接
-                for sidebar in sidebar_elements:
-                    links = sidebar.find_all('a', href=True)
-                    for link in links:
-                        href = link.get('href')
-                        if '/chapter/' in href and self.book_id in href and href != chapter['url']:
-                            title = link.get_text(strip=True)
-                            # 更严格的标题过滤
-                            if (title and len(title) > 2 and 
-                                title not in seen_titles and
-                                title not in ['下一篇', '上一章', '目录', '返回', '书库'] and
-                                ('皇极经世' in title or '发音' in title or '收音' in title or '闭音' in title)):
-                                nested_chapters.append({
-                                    'url': f"{self.base_url}{href}",
-                                    'title': title
-                                })
-                                seen_titles.add(title)
-                                print(f"  发现二级章节: {title}")
-                
-                # 添加延迟
-                time.sleep(self.delay)
+                # 在章节页面的侧边栏导航中查找额外的链接（基于实际HTML结构）
+                for record in self._page_chapter_links(chapter['url']):
+                    if not parsing.in_container(record, ('aside', 'nav', 'div'), parsing.is_sidebar_class):
+                        continue
+                    href = record['url']
+                    if self.book_id in href and href != chapter['url']:
+                        title = record['title']
+                        # 更严格的标题过滤
+                        if (title and len(title) > 2 and 
+                            title not in seen_titles and
+                            title not in ['下一篇', '上一章', '目录', '返回', '书库'] and
+                            ('皇极经世' in title or '发音' in title or '收音' in title or '闭音' in title)):
+                            nested_chapters.append({
+                                'url': f"{self.base_url}{href}",
+                                'title': title
+                            })
+                            seen_titles.add(title)
+                            print(f"  发现二级章节: {title}")
                 
             except Exception as e:
                 print(f"分析章节 {chapter['title']} 失败: {e}")
@@ -258,128 +512,80 @@ class ShidiangujiFetcher:
         print(f"正在获取: {title}")
         
         try:
-            response = self.session.get(url)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # 移除脚本和样式
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            # 基于实际页面结构，优先查找article元素
-            article_content = soup.find('article')
-            if article_content:
-                content = article_content.get_text(separator='\n', strip=True)
-            else:
-                # 查找主要内容区域
-                content_selectors = [
-                    '.chapter-reader-content',
-                    '.content',
-                    '.main-content',
-                    '.text-content',
-                    '#content',
-                    '[class*="content"]',
-                    '[class*="text"]',
-                    '[class*="chapter"]'
-                ]
-                
-                content_elements = []
-                for selector in content_selectors:
-                    elements = soup.select(selector)
-                    content_elements.extend(elements)
-                
-                # 如果没有找到特定内容区域，使用主要文本内容
-                if not content_elements:
-                    # 移除导航、页眉、页脚等
-                    for unwanted in soup.find_all(['nav', 'header', 'footer', 'aside', '.nav', '.menu', '.sidebar']):
-                        unwanted.decompose()
-                    
-                    content = soup.get_text(separator='\n', strip=True)
-                else:
-                    # 使用找到的最大内容元素
-                    main_content = max(content_elements, key=lambda x: len(x.get_text()))
-                    content = main_content.get_text(separator='\n', strip=True)
-            
-            # 检查内容长度，对于皇极经世来说，短内容是正常的
-            if len(content.strip()) < 10:
-                print(f"  警告: {title} 内容为空")
-                return ""
-            
-            # 清理内容
-            content = re.sub(r'识典古籍.*?版权所有', '', content, flags=re.DOTALL)
-            content = re.sub(r'登录后阅读更方便', '', content)
-            content = re.sub(r'书库', '', content)
-            content = re.sub(r'下一篇.*?$', '', content, flags=re.MULTILINE)
-            content = re.sub(r'上一章.*?$', '', content, flags=re.MULTILINE)
-            content = re.sub(r'目录', '', content)
-            
-            # 移除多余的空白行
-            lines = [line.strip() for line in content.split('\n') if line.strip()]
-            content = '\n\n'.join(lines)
-            
-            return content
+            html = self._download_chapter(url)
+            return self._extract_chapter_content(html, title)
             
+        except DeadlineExceeded:
+            self._deadline_skip()
+            return ""
         except Exception as e:
-            print(f"获取失败: {e}")
+            self._chapter_failed(title, url, e)
             return ""
     
+    def _chapter_failed(self, title, url, error):
+        """记录重试后仍然失败的章节"""
+        print(f"获取失败: {error}")
+        self.failed_chapters.append({'title': title, 'url': url, 'error': str(error)})
+    
+    def _response_text(self, response, body=None, final=True):
+        """按响应头或页面 <meta> 声明的编码把页面解码为字符串（见 parsing.decode_html）"""
+        charset = parsing.charset_from_content_type(response.headers.get('Content-Type'))
+        return parsing.decode_html(response.content if body is None else body, charset, final)
+    
+    def _download_chapter(self, url):
+        """下载章节页面，返回解码后的HTML字符串"""
+        if self.stream_parse and not self.offline:
+            return self._stream_chapter(url)
+        
+        # 自适应并发只限制同时进行的下载，解析和清理不占用并发窗口
+        with self.concurrency_controller or nullcontext():
+            response = self._get(url, release=True, hedge=True)
+        response.raise_for_status()
+        self.transfer_stats.record_chapter(url, response)
+        return self._response_text(response)
+    
+    def _stream_chapter(self, url):
+        """流式下载章节页面：边下载边增量解析，<article> 闭合后停止读取剩余内容
+        
+        不经过响应缓存、请求去重和对冲请求；页面超过 MAX_PAGE_MB 时抛出 PageTooLarge。
+        开启内嵌数据时，学到提取策略之前读取完整页面（内嵌数据可能在 <article> 之后）。
+        返回已读取部分解码后的HTML字符串（可能不含正文之后的页脚和脚本）。
+        """
+        strategy = self.strategy_cache.current() if self.strategy_cache else None
+        with self.concurrency_controller or nullcontext():
+            response = self._request(url, stream=True)
+            if not response.ok:
+                response.close()
+                response.raise_for_status()
+            html, stopped = read_streaming(response, parsing.ContentEndDetector(strategy, self.use_payload),
+                                           self.max_page_bytes)
+        
+        self.transfer_stats.record(response, len(html))
+        self.transfer_stats.record_chapter(url, response, len(html))
+        if stopped:
+            with self._stats_lock:
+                self.stream_stopped += 1
+        return self._response_text(response, html, final=not stopped)
+    
+    def _extract_chapter_content(self, html, title):
+        """从章节页面HTML中提取正文，已学到提取策略时直接使用"""
+        strategy = self.strategy_cache.current() if self.strategy_cache else None
+        content, used = self._run_cpu(parsing.extract_with_strategy, html, title,
+                                      self.html_parser, self.use_payload, strategy)
+        if self.strategy_cache:
+            self.strategy_cache.record(used if content else None)
+        return content
+    
     def clean_content(self, content):
         """清理内容格式"""
-        # 移除重复的章节标题
-        lines = content.split('\n')
-        cleaned_lines = []
-        seen_titles = set()
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            # 检查是否是重复的章节标题（常见的古籍标题模式）
-            title_patterns = [
-                r'^.*卷.*[上下中]$',
-                r'^.*卷.*第.*$',
-                r'^.*章.*$',
-                r'^.*节.*$',
-                r'^.*篇.*$',
-                r'^.*之.*$',
-                r'^.*解.*$',
-                r'^.*经.*$',
-                r'^.*论.*$'
-            ]
-            
-            is_title = False
-            for pattern in title_patterns:
-                if re.match(pattern, line):
-                    is_title = True
-                    break
-            
-            if is_title:
-                if line in seen_titles:
-                    continue
-                seen_titles.add(line)
-            
-            cleaned_lines.append(line)
-        
-        # 重新组合内容
-        content = '\n\n'.join(cleaned_lines)
-        
-        # 移除其他重复内容（基于常见的重复模式）
-        content = re.sub(r'(.+)\s*\1+', r'\1', content)  # 移除完全重复的行
-        
-        # 清理常见的无关内容
-        content = re.sub(r'识典古籍.*?版权所有', '', content, flags=re.DOTALL)
-        content = re.sub(r'获取时间.*?获取方式', '', content, flags=re.DOTALL)
-        content = re.sub(r'来源链接.*?$', '', content, flags=re.MULTILINE)
-        
-        # 移除空行过多的地方
-        content = re.sub(r'\n\s*\n\s*\n', '\n\n', content)
-        
-        return content
+        return parsing.clean_content(content)
     
     def save_to_markdown(self, chapters_data, book_title="古籍"):
-        """保存为markdown文件"""
+        """保存为markdown文件
+        
+        chapters_data 可以是列表，也可以是支持 len() 和多次迭代的章节视图，
+        按章节逐个写入，不需要一次性加载全部正文。
+        """
         timestamp = time.strftime("%Y%m%d_%H%M%S")
         filename = f"{book_title}_{timestamp}.md"
         filepath = os.path.join(self.output_dir, filename)
@@ -409,11 +615,205 @@ class ShidiangujiFetcher:
                 f.write("\n\n---\n\n")
         
         print(f"保存完成！共保存 {len(chapters_data)} 个章节到 {filepath}")
+        self._print_transfer_summary()
         return filepath
     
+    def _print_transfer_summary(self):
+        """打印传输字节统计：网络字节（压缩后）和解码后字节"""
+        stats = self.transfer_stats
+        if not stats.requests:
+            return
+        print(f"传输字节: 共 {stats.requests} 次请求，网络 {format_file_size(stats.wire_bytes)}，"
+              f"解码后 {format_file_size(stats.decoded_bytes)}，压缩节省 {stats.saved_ratio():.0%}")
+        if stats.unknown:
+            print(f"  {stats.unknown} 次请求的网络字节无法统计，未计入网络字节和压缩比例")
+        if stats.chapters:
+            wire, decoded = stats.chapter_totals()
+            print(f"  章节页面: {len(stats.chapters)} 个，网络 {format_file_size(wire)}，"
+                  f"解码后 {format_file_size(decoded)}")
+            print("  网络字节最多的章节:")
+            for url, (wire, decoded) in stats.largest_chapters():
+                wire = '未知' if wire is None else format_file_size(wire)
+                print(f"    {wire} (解码后 {format_file_size(decoded)}) {url}")
+    
+    def _deadline_reached(self):
+        """运行截止时间已到时跳过剩余章节"""
+        remaining = self._deadline_remaining()
+        if remaining is not None and remaining <= 0:
+            self._deadline_skip()
+            return True
+        return False
+    
+    def _deadline_skip(self):
+        """记录一个因运行截止时间未获取的章节（包括截止时正在获取的章节）"""
+        with self._stats_lock:
+            self.deadline_skipped += 1
+    
+    def _fetch_chapter(self, chapter):
+        """获取并清理单个章节，成功时存入章节存储并返回True"""
+        if self._deadline_reached():
+            return False
+        content = self.get_chapter_content(chapter['url'], chapter['title'])
+        chapter_data = self._build_chapter_data(chapter, content)
+        if not chapter_data:
+            return False
+        self._chapter_done(chapter_data)
+        return True
+    
+    def _chapter_done(self, chapter_data):
+        """已完成的章节写入断点日志和章节存储"""
+        if self.journal:
+            self.journal.append(chapter_data)
+        self.chapter_store.put(chapter_data)
+    
+    def _build_chapter_data(self, chapter, content):
+        """清理章节正文，无有效内容时返回None"""
+        return self._run_cpu(parsing.build_chapter_data, chapter, content)
+    
+    def _run_cpu(self, func, *args):
+        """执行CPU密集的解析/清理函数，配置了进程池时交给子进程执行"""
+        if self.parse_pool is None:
+            return func(*args)
+        return self.parse_pool.submit(func, *args).result()
+    
+    def _fetch_chapters_serial(self, chapters):
+        """逐章串行获取（兼容模式），返回成功的章节数"""
+        fetched = 0
+        for i, chapter in enumerate(chapters, 1):
+            self._print_progress(i, len(chapters))
+            if self._fetch_chapter(chapter):
+                fetched += 1
+        
+        return fetched
+    
+    def _fetch_chapters_async(self, chapters):
+        """使用asyncio并发获取章节，返回成功的章节数"""
+        print(f"并发模式: 最多同时获取 {self.workers} 个章节")
+        results = asyncio.run(self._gather_chapters(chapters))
+        return sum(results)
+    
+    async def _gather_chapters(self, chapters):
+        """并发调度所有章节请求，返回每个章节是否成功"""
+        semaphore = asyncio.Semaphore(self.workers)
+        loop = asyncio.get_running_loop()
+        completed = 0
+        
+        # requests是阻塞库，放到线程池中执行，由信号量控制并发数
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            async def fetch_one(chapter):
+                nonlocal completed
+                async with semaphore:
+                    success = await loop.run_in_executor(executor, self._fetch_chapter, chapter)
+                    completed += 1
+                    self._print_progress(completed, len(chapters))
+                    return success
+            
+            return await asyncio.gather(*(fetch_one(chapter) for chapter in chapters))
+    
+    def _fetch_chapters_threaded(self, chapters):
+        """使用线程池并发获取章节，返回成功的章节数"""
+        print(f"线程池模式: {self.workers} 个工作线程")
+        completed = 0
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self._fetch_chapter, chapter) for chapter in chapters]
+            try:
+                for _ in as_completed(futures):
+                    completed += 1
+                    self._print_progress(completed, len(chapters))
+            except BaseException:
+                # 中断（Ctrl-C）时取消尚未开始的章节，只等待正在获取的章节结束
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            
+            return sum(future.result() for future in futures)
+    
+    def _fetch_chapters_pipeline(self, chapters):
+        """流水线模式：下载、解析、清理、写入各阶段同时进行，返回成功的章节数
+        
+        阶段之间由有界队列连接，解析和清理在等待网络时同步进行，
+        下游处理不过来时下载会暂停，内存中在途的页面数量有上限。
+        """
+        print(f"流水线模式: {self.workers} 个下载线程，队列容量 {self.queue_size}")
+        completed = 0
+        fetched = 0
+        lock = threading.Lock()
+        
+        def download(chapter):
+            nonlocal completed
+            if self._deadline_reached():
+                return None
+            print(f"正在获取: {chapter['title']}")
+            try:
+                html = self._download_chapter(chapter['url'])
+            except DeadlineExceeded:
+                self._deadline_skip()
+                html = None
+            except Exception as e:
+                self._chapter_failed(chapter['title'], chapter['url'], e)
+                html = None
+            with lock:
+                completed += 1
+                self._print_progress(completed, len(chapters))
+            return (chapter, html) if html is not None else None
+        
+        def parse(item):
+            chapter, html = item
+            try:
+                return chapter, self._extract_chapter_content(html, chapter['title'])
+            except Exception as e:
+                self._chapter_failed(chapter['title'], chapter['url'], e)
+                return None
+        
+        def clean(item):
+            return self._build_chapter_data(*item)
+        
+        def write(index, chapter_data):
+            nonlocal fetched
+            self._chapter_done(chapter_data)
+            fetched += 1
+        
+        pipeline = Pipeline(self.queue_size)
+        pipeline.add_stage('下载', download, workers=self.workers)
+        # 使用进程池时，每个工作线程对应一个解析进程
+        pipeline.add_stage('解析', parse, workers=max(1, self.parse_workers))
+        pipeline.add_stage('清理', clean, workers=max(1, self.parse_workers))
+        pipeline.run(chapters, write)
+        
+        return fetched
+    
+    def _print_progress(self, completed, total):
+        """打印进度，自适应并发时附带当前并发窗口"""
+        if self.concurrency_controller:
+            print(f"进度: {completed}/{total} (并发窗口: {self.concurrency_controller.window})")
+        else:
+            print(f"进度: {completed}/{total}")
+    
+    def _print_run_summary(self):
+        """打印本次运行的请求统计"""
+        controller = self.concurrency_controller
+        if controller:
+            print(f"自适应并发: 当前窗口 {controller.window}，峰值 {controller.peak}，"
+                  f"增加 {controller.increases} 次，减少 {controller.decreases} 次，"
+                  f"p95延迟 {controller.p95():.2f} 秒")
+        if self.response_cache and self.response_cache.revalidated:
+            print(f"条件请求: {self.response_cache.revalidated} 个页面未变化，已复用本地缓存")
+        if self.hedged:
+            print(f"对冲请求: {self.hedged} 个章节请求超过p95耗时，已发出对冲请求")
+        if self.request_memo and self.request_memo.saved:
+            print(f"请求去重: 节省 {self.request_memo.saved} 次重复请求")
+        if self.stream_stopped:
+            print(f"流式解析: {self.stream_stopped} 个章节在正文结束后提前停止下载")
+        if self.strategy_cache and self.strategy_cache.reprobed:
+            print(f"提取策略: {self.strategy_cache.reprobed} 次失效后重新探测")
+        if self.offline:
+            print(f"离线模式: 从缓存回放 {self.response_cache.replayed} 个页面")
+    
     def fetch_book(self, book_title=None):
         """获取整本书的内容"""
         print(f"开始获取书籍: {book_title or self.book_id}")
+        if self.run_deadline:
+            self._deadline = time.monotonic() + self.run_deadline
         
         # 获取章节列表
         chapters = self.analyze_book_structure()
@@ -430,31 +830,86 @@ class ShidiangujiFetcher:
                 seen_urls.add(chapter['url'])
                 unique_chapters.append(chapter)
         
-        print(f"准备获取 {len(unique_chapters)} 个章节...")
+        if self.learn_strategy:
+            self.strategy_cache = StrategyCache(os.path.join(self.cache_dir, 'strategies.json'), self.book_id)
+            if self.strategy_cache.loaded:
+                print(f"提取策略: 使用上次保存的 {describe_strategy(self.strategy_cache.current())}")
+        
+        # 已完成的章节保存在章节存储中，超出内存上限的部分写入临时文件
+        self.chapter_store = ChapterStore(self.memory_limit, self.output_dir)
+        
+        # 断点续传：从日志恢复已完成的章节，只获取剩余章节
+        self.journal = ChapterJournal(os.path.join(self.output_dir, f"{self.book_id}.journal.jsonl"))
+        if self.resume:
+            for chapter_data in self.journal.iter_chapters():
+                self.chapter_store.put(chapter_data)
+        else:
+            self.journal.reset()
+        
+        pending_chapters = [chapter for chapter in unique_chapters if chapter['url'] not in self.chapter_store]
+        if len(pending_chapters) < len(unique_chapters):
+            print(f"断点续传: 日志中已有 {len(unique_chapters) - len(pending_chapters)} 个章节")
+        
+        print(f"准备获取 {len(pending_chapters)} 个章节...")
         
         # 获取每个章节的内容
-        chapters_data = []
-        for i, chapter in enumerate(unique_chapters, 1):
-            print(f"进度: {i}/{len(unique_chapters)}")
-            content = self.get_chapter_content(chapter['url'], chapter['title'])
-            
-            if content and len(content) > 100:  # 只保存有实际内容的章节
-                cleaned_content = self.clean_content(content)
-                chapters_data.append({
-                    'title': chapter['title'],
-                    'url': chapter['url'],
-                    'content': cleaned_content
-                })
-            
-            # 添加延迟避免请求过快
-            time.sleep(self.delay)
+        if self.parse_workers:
+            print(f"解析进程池: {self.parse_workers} 个进程")
+            self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        if self.hedge_requests:
+            self.hedge_pool = ThreadPoolExecutor(max_workers=self.workers * 2)
+        try:
+            if self.fetch_mode == 'async':
+                fetched = self._fetch_chapters_async(pending_chapters)
+            elif self.fetch_mode == 'thread':
+                fetched = self._fetch_chapters_threaded(pending_chapters)
+            elif self.fetch_mode == 'pipeline':
+                fetched = self._fetch_chapters_pipeline(pending_chapters)
+            else:
+                fetched = self._fetch_chapters_serial(pending_chapters)
+        except KeyboardInterrupt:
+            print(f"\n已中断，已完成的章节保存在 {self.journal.path}，设置 RESUME=1 可继续获取")
+            raise
+        finally:
+            self.journal.close()
+            if self.parse_pool:
+                self.parse_pool.shutdown()
+                self.parse_pool = None
+            if self.hedge_pool:
+                # 落后的对冲请求不再需要，不等待它们结束
+                self.hedge_pool.shutdown(wait=False, cancel_futures=True)
+                self.hedge_pool = None
+        
+        print(f"本次获取完成: {fetched}/{len(pending_chapters)} 个章节")
+        
+        # 按目录顺序从存储中流式读取日志中的章节和本次获取的章节
+        chapters_data = self.chapter_store.ordered([chapter['url'] for chapter in unique_chapters])
+        
+        self._print_run_summary()
+        if self.chapter_store.spilled:
+            print(f"内存上限: {self.chapter_store.spilled} 个章节超出 {format_file_size(self.memory_limit)} 上限，已写入临时文件")
+        
+        if self.deadline_skipped:
+            print(f"⏰ 已达到运行截止时间，{self.deadline_skipped} 个章节未获取")
+        
+        if self.failed_chapters:
+            print(f"⚠️ 以下 {len(self.failed_chapters)} 个章节重试后仍获取失败:")
+            for failed in self.failed_chapters:
+                print(f"  - {failed['title']}: {failed['error']}")
         
         # 保存为markdown文件
+        filepath = None
         if chapters_data:
-            return self.save_to_markdown(chapters_data, book_title or f"书籍_{self.book_id}")
+            filepath = self.save_to_markdown(chapters_data, book_title or f"书籍_{self.book_id}")
+            if self.failed_chapters or self.deadline_skipped:
+                print(f"断点日志已保留: {self.journal.path}，设置 RESUME=1 可只重新获取失败的章节")
+            else:
+                self.journal.remove()
         else:
             print("未获取到任何内容")
-            return None
+        
+        self.chapter_store.close()
+        return filepath
 
 def main():
     fetcher = ShidiangujiFetcher()
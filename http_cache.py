@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP响应缓存
+按URL保存原始响应内容和 ETag / Last-Modified，重复获取时发送条件请求，
+服务器返回304时直接复用本地内容；离线模式下完全从缓存回放
+"""
+
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class OfflineCacheMiss(requests.RequestException):
+    """离线模式下请求的URL不在缓存中"""
+
+
+class RequestMemo:
+    """单次运行内的请求记忆与single-flight去重
+
+    同一URL在一次运行中只真正请求一次：已完成的响应直接复用，
+    正在进行中的请求由后来者等待同一个结果。请求失败的结果（异常或非2xx/304响应）
+    不会被记住。
+    """
+
+    def __init__(self):
+        self.saved = 0
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, send, release=False):
+        """获取URL的响应，send(url) 负责真正发出请求
+
+        release=True 表示调用方是该URL的最后一个使用者，返回后不再保留响应，
+        避免整本书的章节页面都常驻内存。
+        """
+        with self._lock:
+            future = self._futures.get(url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._futures[url] = future
+            else:
+                self.saved += 1
+
+        if owner:
+            try:
+                response = send(url)
+            except BaseException as e:
+                future.set_exception(e)
+                self._forget(url, future)
+                raise
+            future.set_result(response)
+            # 重试用尽后返回的错误响应与异常一样不记住，之后的请求重新获取
+            if not (200 <= response.status_code < 300 or response.status_code == 304):
+                self._forget(url, future)
+
+        response = future.result()
+        if release:
+            self._forget(url, future)
+        return response
+
+    def _forget(self, url, future):
+        with self._lock:
+            if self._futures.get(url) is future:
+                del self._futures[url]
+
+
+class ResponseCache:
+    """基于磁盘的响应缓存
+
+    响应内容以gzip压缩保存在 bodies/ 目录下，文件名为URL的sha256；
+    URL、校验头、大小和最近访问时间保存在同目录的sqlite索引中。
+    压缩后总大小超过 max_bytes 时按最近最少使用(LRU)淘汰。
+    """
+
+    def __init__(self, cache_dir, max_bytes=0):
+        self.cache_dir = cache_dir
+        self.body_dir = os.path.join(cache_dir, 'bodies')
+        os.makedirs(self.body_dir, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self.revalidated = 0
+        self.replayed = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite3'), check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, url TEXT, etag TEXT, last_modified TEXT, '
+                'content_type TEXT, size INTEGER, updated_at REAL, accessed_at REAL)'
+            )
+            columns = [row[1] for row in self._db.execute('PRAGMA table_info(entries)')]
+            if 'accessed_at' not in columns:
+                # 兼容旧版本只保存校验头的索引
+                self._db.execute('ALTER TABLE entries ADD COLUMN accessed_at REAL DEFAULT 0')
+            self._total_bytes = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    @staticmethod
+    def url_key(url):
+        """URL对应的缓存键"""
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _body_path(self, key):
+        return os.path.join(self.body_dir, key[:2], f"{key}.gz")
+
+    def lookup(self, url):
+        """查找URL的缓存记录，内容文件缺失时视为未命中"""
+        key = self.url_key(url)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT etag, last_modified, content_type FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+        if not row or not os.path.exists(self._body_path(key)):
+            return None
+        return {'key': key, 'url': url, 'etag': row[0], 'last_modified': row[1], 'content_type': row[2]}
+
+    def conditional_headers(self, entry):
+        """根据缓存记录生成条件请求头"""
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def load(self, entry):
+        """把缓存记录还原为 requests.Response"""
+        with gzip.open(self._body_path(entry['key']), 'rb') as f:
+            body = f.read()
+
+        with self._lock, self._db:
+            self._db.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (time.time(), entry['key']))
+
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = entry['url']
+        response._content = body
+        response.headers = CaseInsensitiveDict()
+        for header, value in (('Content-Type', entry['content_type']),
+                              ('ETag', entry['etag']),
+                              ('Last-Modified', entry['last_modified'])):
+            if value:
+                response.headers[header] = value
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+    def revalidate(self, entry):
+        """服务器返回304，复用缓存内容"""
+        with self._lock:
+            self.revalidated += 1
+        return self.load(entry)
+
+    def replay(self, url):
+        """离线模式：从缓存返回响应，未命中时抛出 OfflineCacheMiss"""
+        entry = self.lookup(url)
+        if not entry:
+            raise OfflineCacheMiss(f"离线模式下缓存未命中: {url}")
+        with self._lock:
+            self.replayed += 1
+        return self.load(entry)
+
+    def store(self, url, response):
+        """保存200响应的原始内容和校验头"""
+        if response.status_code != 200:
+            return
+
+        key = self.url_key(url)
+        path = self._body_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，避免并发读取到写了一半的内容
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, 'wb') as f:
+            f.write(response.content)
+        os.replace(tmp_path, path)
+
+        size = os.path.getsize(path)
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            self._total_bytes += size - (row[0] if row else 0)
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, url, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                 response.headers.get('Content-Type'), size, now, now)
+            )
+            self._evict(keep=key)
+
+    def _evict(self, keep):
+        """总大小超过上限时，淘汰最久未访问的记录（调用方需持有锁）"""
+        if not self.max_bytes or self._total_bytes <= self.max_bytes:
+            return
+
+        rows = self._db.execute(
+            'SELECT key, size FROM entries WHERE key != ? ORDER BY accessed_at', (keep,)
+        ).fetchall()
+        for key, size in rows:
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._body_path(key))
+            except FileNotFoundError:
+                pass
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._total_bytes -= size
@@ -0,0 +1,613 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+章节页面解析与清理
+纯函数实现，不依赖 ShidiangujiFetcher 的状态，参数和返回值都可以pickle，
+因此既可以直接调用，也可以交给 ProcessPoolExecutor 在多个进程中并行执行
+
+HTML解析后端（HTML_PARSER）：
+  html.parser  Python内置解析器（默认）
+  lxml         基于libxml2的BeautifulSoup后端，速度快数倍
+  selectolax   基于lexbor的快速路径，页面有 <article> 时直接提取正文，
+               否则回退到 lxml（或 html.parser）走BeautifulSoup流程
+
+页面 <script> 中内嵌了章节数据、且其中的正文与DOM正文长度相当时，改为从JSON中提取正文
+（见 embedded_data）；学到该策略后，后续章节不再构建DOM树。
+"""
+
+import bisect
+import codecs
+import re
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup, CData, NavigableString, Tag, UnicodeDammit
+
+from embedded_data import CJK_CHAR, extract_payload_text
+
+PARSERS = ('html.parser', 'lxml', 'selectolax')
+# 内嵌数据中的文字至少要有DOM正文这么大比例的汉字，才当作章节正文
+PAYLOAD_MIN_RATIO = 0.5
+
+# 页面编码声明：Content-Type 响应头、页面开头的 <meta charset> 或 http-equiv
+CONTENT_TYPE_CHARSET = re.compile(r'charset\s*=\s*["\']?\s*([-\w.:]+)', re.IGNORECASE)
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([-\w.:]+)', re.IGNORECASE)
+META_SCAN_BYTES = 4096
+BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+CHARSET_ALIASES = {
+    'gb2312': 'gb18030', 'gbk': 'gb18030', 'x-gbk': 'gb18030', 'cp936': 'gb18030', 'euc-cn': 'gb18030',
+    'utf8': 'utf-8',
+}
+
+# 正文清理规则，模块加载时编译一次。
+# 站点固定文字按原有顺序依次删除：删掉一处后前后文字可能拼出另一处，顺序不能改变
+SITE_FOOTER = re.compile(r'识典古籍.*?版权所有', re.DOTALL)
+SITE_PHRASES = ('登录后阅读更方便', '书库')
+# 上一章/下一篇到行尾：两者互不重叠，合并为一个模式与依次删除的结果相同
+PAGER_TAIL = re.compile(r'(?:下一篇|上一章).*$', re.MULTILINE)
+# 常见的古籍标题模式，合并自 .*卷.*[上下中]$、.*卷.*第.*、.*章.*、.*节.*、
+# .*篇.*、.*之.*、.*解.*、.*经.*、.*论.*（逐行 re.match）
+TITLE_LINE = re.compile(r'卷.*(?:[上下中]$|第)|[章节篇之解经论]')
+REPEATED_TEXT = re.compile(r'(.+)\s*\1+')
+REPEATED_CHAR = re.compile(r'(?=(.)\s*\1)')
+FETCH_INFO = re.compile(r'获取时间.*?获取方式', re.DOTALL)
+SOURCE_LINK = re.compile(r'来源链接.*?$', re.MULTILINE)
+EXTRA_BLANK_LINES = re.compile(r'\n\s*\n\s*\n')
+
+
+def resolve_parser(name):
+    """检查解析后端是否可用，依赖缺失时回退并打印提示，返回实际使用的后端"""
+    name = (name or 'html.parser').strip().lower()
+    if name not in PARSERS:
+        print(f"未知的HTML解析后端 {name}，使用 html.parser")
+        return 'html.parser'
+
+    if name == 'selectolax':
+        try:
+            import selectolax.lexbor  # noqa: F401
+        except ImportError:
+            print("selectolax 未安装（pip install selectolax），改用 lxml")
+            name = 'lxml'
+
+    if name == 'lxml':
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            print("lxml 未安装，改用 html.parser")
+            name = 'html.parser'
+    return name
+
+
+def soup_parser(parser):
+    """BeautifulSoup使用的解析器名称，selectolax 没有BeautifulSoup后端，使用 lxml"""
+    if parser != 'selectolax':
+        return parser
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+def make_soup(html, parser='html.parser'):
+    """按解析后端创建BeautifulSoup"""
+    return BeautifulSoup(html, soup_parser(parser))
+
+
+def is_toc_container_class(css_class):
+    """目录页中可能包含章节链接的容器"""
+    return css_class and ('chapter' in css_class or 'toc' in css_class or 'menu' in css_class)
+
+
+def is_sidebar_class(css_class):
+    """章节页面中的侧边栏导航"""
+    return css_class and any(keyword in css_class.lower() for keyword in
+                             ['sidebar', 'nav', 'menu', 'chapter', '目录', '导航'])
+
+
+def in_container(record, tags, class_filter):
+    """章节链接是否位于指定标签且 class 满足 class_filter 的容器中"""
+    return any(tag in tags and class_filter(css_class) for tag, css_class in record['container'])
+
+
+class ChapterLinkExtractor(HTMLParser):
+    """单遍流式提取章节链接
+
+    边读取HTML边输出每个 href 含 /chapter/ 的链接，不构建DOM树：
+      url        页面中的原始 href
+      title      链接文字（各文本节点去除首尾空白后直接连接，同 get_text(strip=True)）
+      container  外层容器路径 ((标签, class), ...)，由外到内，只记录带 class 的容器
+      depth      所在列表（ul/ol）的嵌套层数，用于区分多级目录
+    """
+
+    CONTAINER_TAGS = ('div', 'nav', 'ul', 'ol', 'aside', 'section')
+    LIST_TAGS = ('ul', 'ol')
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.records = []
+        self._open = []
+        self._link = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.CONTAINER_TAGS:
+            self._open.append((tag, dict(attrs).get('class') or ''))
+        elif tag == 'a':
+            # <a> 不能嵌套，未闭合的链接在下一个链接开始时结束
+            self._finish_link()
+            href = dict(attrs).get('href')
+            if href is not None and '/chapter/' in href:
+                self._link = {
+                    'url': href,
+                    'parts': [],
+                    'container': tuple((name, css_class) for name, css_class in self._open if css_class),
+                    'depth': sum(1 for name, _ in self._open if name in self.LIST_TAGS)
+                }
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._finish_link()
+        elif tag in self.CONTAINER_TAGS:
+            # 与最近的同名容器配对，容忍未闭合的内层标签
+            for index in range(len(self._open) - 1, -1, -1):
+                if self._open[index][0] == tag:
+                    del self._open[index:]
+                    break
+
+    def handle_data(self, data):
+        if self._link is not None:
+            text = data.strip()
+            if text:
+                self._link['parts'].append(text)
+
+    def close(self):
+        super().close()
+        self._finish_link()
+
+    def _finish_link(self):
+        link, self._link = self._link, None
+        if link is not None:
+            self.records.append({
+                'url': link['url'],
+                'title': ''.join(link['parts']),
+                'container': link['container'],
+                'depth': link['depth']
+            })
+
+
+class ContentEndDetector(HTMLParser):
+    """增量解析正在下载的页面，正文容器闭合后通知调用方停止读取
+
+    每次调用 detector(chunk) 传入一块原始字节，容器已闭合时返回True。
+    按 latin-1 解码只为识别标签：标签和属性名都是ASCII，UTF-8 和 GB18030
+    的多字节字符中也不会出现 '<'、'>'，因此不需要先确定页面编码。
+    只在提取策略为 article 时等待第一个 <article> 闭合，与提取时选中的元素相同；
+    block 策略提取的是匹配元素中文字最多的一个，读完前无法确定，与 payload/page 一样
+    需要完整页面，不会提前停止。
+    还没有策略（探测阶段）时，use_payload=True 需要完整页面：内嵌数据的 <script>
+    可能在 <article> 之后；不使用内嵌数据时探测的结果就是第一个 <article>。
+    """
+
+    def __init__(self, strategy=None, use_payload=True):
+        super().__init__(convert_charrefs=False)
+        if strategy:
+            method = strategy.get('method')
+        else:
+            method = None if use_payload else 'article'
+        self.target = 'article' if method == 'article' else None
+        self.done = False
+        self._depth = 0
+
+    def __call__(self, chunk):
+        if self.target is not None and not self.done:
+            self.feed(chunk.decode('latin-1'))
+        return self.done
+
+    def handle_starttag(self, tag, attrs):
+        if tag == self.target and not self.done:
+            self._depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # <div/> 这样的自闭合写法不包含内容
+        pass
+
+    def handle_endtag(self, tag):
+        if self._depth and tag == self.target:
+            self._depth -= 1
+            if self._depth == 0:
+                self.done = True
+
+
+def extract_chapter_links(html, chunk_size=65536):
+    """单遍读取页面，返回所有章节链接记录（见 ChapterLinkExtractor），按页面顺序排列"""
+    html = decode_html(html)
+
+    extractor = ChapterLinkExtractor()
+    for start in range(0, len(html), chunk_size):
+        extractor.feed(html[start:start + chunk_size])
+    extractor.close()
+    return extractor.records
+
+
+def _selectolax_article_text(html):
+    """selectolax快速路径：返回 <article> 的正文，没有 <article> 时返回None
+
+    各文本节点去除首尾空白后按行连接，与 get_text(separator='\n', strip=True) 相同。
+    """
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(decode_html(html))
+    article = tree.css_first('article')
+    if article is None:
+        return None
+
+    for node in article.css('script, style'):
+        node.decompose()
+    lines = (line.strip() for line in article.text(separator='\n').split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+def charset_from_content_type(content_type):
+    """从 Content-Type 响应头中取出声明的编码，没有声明时返回None"""
+    match = CONTENT_TYPE_CHARSET.search(content_type or '')
+    return match.group(1) if match else None
+
+
+def declared_charset(html, declared=None):
+    """页面的声明编码：BOM优先，其次是HTTP头声明的编码，最后是页面开头的 <meta>
+
+    GB2312/GBK 按其超集 GB18030 解码，古籍页面中常有超出GB2312字符集的生僻字。
+    """
+    for bom, encoding in BOMS:
+        if html.startswith(bom):
+            return encoding
+    if not declared:
+        match = META_CHARSET.search(html, 0, META_SCAN_BYTES)
+        if match:
+            declared = match.group(1).decode('ascii', 'replace')
+    if not declared:
+        return None
+    declared = declared.strip().lower()
+    return CHARSET_ALIASES.get(declared, declared)
+
+
+def decode_html(html, declared=None, final=True):
+    """把页面字节解码为字符串
+
+    按声明的编码（见 declared_charset）直接解码一次；没有声明时依次尝试UTF-8和GB18030。
+    声明的编码无效或解码失败时才用BeautifulSoup的编码检测（UnicodeDammit）。
+    final=False 表示页面被截断（流式下载提前停止），末尾不完整的多字节字符会被丢弃。
+    """
+    if not isinstance(html, bytes):
+        return html
+
+    encoding = declared_charset(html, declared)
+    for candidate in ((encoding,) if encoding else ('utf-8', 'gb18030')):
+        try:
+            if final:
+                return html.decode(candidate)
+            return codecs.getincrementaldecoder(candidate)().decode(html, final=False)
+        except (LookupError, UnicodeDecodeError):
+            continue
+    return UnicodeDammit(html, is_html=True).unicode_markup
+
+
+def extract_chapter_content(html, title, parser='html.parser', use_payload=True):
+    """从章节页面HTML中提取正文
+
+    parser 为解析后端（见模块说明）；use_payload=True 时先尝试页面内嵌的JSON数据，
+    找不到正文时才解析DOM。页面只解码一次，各条路径共用解码后的字符串。
+    """
+    return extract_with_strategy(html, title, parser, use_payload)[0]
+
+
+def extract_with_strategy(html, title, parser='html.parser', use_payload=True, strategy=None):
+    """按已知的提取策略提取正文，返回 (正文, 实际使用的策略)
+
+    策略是可以保存为JSON的字典，method 为：
+      payload  页面内嵌的JSON数据
+      article  <article> 元素
+      block    指定标签和 class 的内容区域（tag / class / id）
+      page     去掉导航等元素后的整页文字
+    strategy 为None或按该策略提取不到内容时，依次尝试全部策略。
+    """
+    html = decode_html(html)
+    if strategy:
+        content = _apply_strategy(html, parser, use_payload, strategy)
+        if content and len(content.strip()) >= 10:
+            return _finish_chapter_content(content, title), strategy
+
+    content, strategy = _probe_strategies(html, parser, use_payload)
+    return _finish_chapter_content(content, title), strategy
+
+
+def _probe_strategies(html, parser, use_payload):
+    """依次尝试各策略，返回 (未清理的正文, 使用的策略)
+
+    内嵌数据中找到的文字可能只是简介、分享文案等，只有汉字数不少于DOM正文的
+    PAYLOAD_MIN_RATIO 时才当作章节正文。
+    """
+    content = None
+    if parser == 'selectolax':
+        content = _selectolax_article_text(html)
+        strategy = {'method': 'article'}
+    if content is None:
+        content, strategy = _extract_with_soup(html, parser)
+
+    if use_payload:
+        payload = extract_payload_text(html)
+        if payload is not None and _cjk_count(payload) >= _cjk_count(content) * PAYLOAD_MIN_RATIO:
+            return payload, {'method': 'payload'}
+    return content, strategy
+
+
+def _cjk_count(text):
+    return len(CJK_CHAR.findall(text))
+
+
+def _apply_strategy(html, parser, use_payload, strategy):
+    """直接按策略提取未清理的正文，提取不到时返回None"""
+    method = strategy.get('method')
+    if method == 'payload':
+        return extract_payload_text(html) if use_payload else None
+    if method == 'article' and parser == 'selectolax':
+        return _selectolax_article_text(html)
+
+    soup = _clean_soup(html, parser)
+    if method == 'article':
+        element = soup.find('article')
+    elif method == 'block':
+        # 与探测时（find_content_block）一致，取匹配元素中文字最多的一个：
+        # 页面中可能还有同样 class 的提示、简介等短内容
+        attrs = {'class': strategy['class']} if strategy.get('class') else {'id': strategy.get('id')}
+        element = max(soup.find_all(strategy.get('tag'), attrs=attrs),
+                      key=lambda candidate: len(candidate.get_text()), default=None)
+    elif method == 'page':
+        return _page_text(soup)
+    else:
+        return None
+    return element.get_text(separator='\n', strip=True) if element else None
+
+
+def _clean_soup(html, parser):
+    """创建BeautifulSoup并移除脚本和样式"""
+    soup = make_soup(html, parser)
+    for script in soup(["script", "style"]):
+        script.decompose()
+    return soup
+
+
+def _page_text(soup):
+    """去掉导航、页眉、页脚等之后的整页文字"""
+    for unwanted in soup.find_all(['nav', 'header', 'footer', 'aside', '.nav', '.menu', '.sidebar']):
+        unwanted.decompose()
+    return soup.get_text(separator='\n', strip=True)
+
+
+def _extract_with_soup(html, parser):
+    """用BeautifulSoup按页面结构查找正文区域，返回 (正文, 使用的策略)"""
+    # 移除脚本和样式
+    soup = _clean_soup(html, parser)
+
+    # 基于实际页面结构，优先查找article元素
+    article_content = soup.find('article')
+    if article_content:
+        return article_content.get_text(separator='\n', strip=True), {'method': 'article'}
+
+    # 一次自底向上遍历为内容区域候选打分
+    main_content = find_content_block(soup)
+
+    # 如果没有找到特定内容区域，使用主要文本内容
+    if main_content is None:
+        return _page_text(soup), {'method': 'page'}
+
+    # 使用找到的最大内容元素
+    classes = main_content.get('class') or []
+    if isinstance(classes, str):
+        classes = classes.split()
+    strategy = {'method': 'block', 'tag': main_content.name,
+                'class': ' '.join(classes), 'id': main_content.get('id')}
+    return main_content.get_text(separator='\n', strip=True), strategy
+
+
+def _content_selector_rank(tag):
+    """内容区域选择器的优先级，数字越小越优先，不是候选时返回None
+
+    依次对应 .chapter-reader-content、.content、.main-content、.text-content、
+    #content、[class*="content"]、[class*="text"]、[class*="chapter"]
+    """
+    classes = tag.get('class') or []
+    if isinstance(classes, str):
+        classes = classes.split()
+    if 'chapter-reader-content' in classes:
+        return 0
+    if 'content' in classes:
+        return 1
+    if 'main-content' in classes:
+        return 2
+    if 'text-content' in classes:
+        return 3
+    if tag.get('id') == 'content':
+        return 4
+    joined = ' '.join(classes)
+    if 'content' in joined:
+        return 5
+    if 'text' in joined:
+        return 6
+    if 'chapter' in joined:
+        return 7
+    return None
+
+
+def find_content_block(soup):
+    """一次遍历找出文字最多的内容区域，没有候选时返回None
+
+    按文档逆序（子节点先于父节点）累加每个节点的文字长度，每个节点只计算一次，
+    时间与节点数成线性关系。长度相同时按选择器优先级、再按文档顺序取第一个，
+    与逐个选择器 select() 后 max(key=len(get_text())) 的结果一致。
+    """
+    nodes = list(soup.descendants)
+    lengths = {}
+    best, best_key = None, None
+    for order in range(len(nodes) - 1, -1, -1):
+        node = nodes[order]
+        if isinstance(node, Tag):
+            length = sum(lengths.get(id(child), 0) for child in node.contents)
+            lengths[id(node)] = length
+            rank = _content_selector_rank(node)
+            if rank is not None:
+                key = (length, -rank, -order)
+                if best_key is None or key > best_key:
+                    best, best_key = node, key
+        elif type(node) in (NavigableString, CData):
+            # 与 get_text() 一致：只计算普通文本，不包括注释等
+            lengths[id(node)] = len(node)
+    return best
+
+
+def _finish_chapter_content(content, title):
+    """检查正文长度并去除站点固定文字和多余空行"""
+    # 检查内容长度，对于皇极经世来说，短内容是正常的
+    if len(content.strip()) < 10:
+        print(f"  警告: {title} 内容为空")
+        return ""
+
+    # 清理内容
+    content = SITE_FOOTER.sub('', content)
+    for phrase in SITE_PHRASES:
+        content = content.replace(phrase, '')
+    content = PAGER_TAIL.sub('', content)
+    content = content.replace('目录', '')
+
+    # 移除多余的空白行
+    lines = [line.strip() for line in content.split('\n') if line.strip()]
+    content = '\n\n'.join(lines)
+
+    return content
+
+
+def _repeat_end(content, unit, position):
+    """从 position 开始连续重复 unit 的结束位置"""
+    position += len(unit)
+    while content.startswith(unit, position):
+        position += len(unit)
+    return position
+
+
+def _repeat_at(content, start, eol, positions, single):
+    """REPEATED_TEXT 在 start 处的匹配，返回 (重复单元, 结束位置)，不匹配时返回None
+
+    与正则的回溯顺序相同：重复单元从长到短，同一长度时中间的空白从多到少。
+    长度为2以上的重复单元，重复出现的位置一定是开头两个字符再次出现的位置（positions，升序）。
+    """
+    pairs = []
+    for copy in positions[bisect.bisect_left(positions, start + 2):]:
+        if not content[copy - 1].isspace():
+            pairs.append((copy - start, copy))
+            continue
+        # 重复单元与再次出现之间只能是空白
+        gap = max(copy - 1, start + 2)
+        while gap > start + 2 and content[gap - 1].isspace():
+            gap -= 1
+        pairs.extend((size, copy) for size in range(gap - start, min(copy, eol) - start + 1))
+    pairs.sort(reverse=True)
+    for size, copy in pairs:
+        unit = content[start:start + size]
+        if content.startswith(unit, copy):
+            return unit, _repeat_end(content, unit, copy)
+
+    if single:
+        unit = content[start]
+        copy = start + 1
+        while copy < len(content) and content[copy].isspace():
+            copy += 1
+        for copy in range(min(copy, len(content) - 1), start, -1):
+            if content[copy] == unit:
+                return unit, _repeat_end(content, unit, copy)
+    return None
+
+
+def remove_repeated_text(content):
+    """移除紧接着重复的文字，结果与 REPEATED_TEXT.sub(r'\1', content) 相同
+
+    (.+) 在每个位置都要从行尾逐个字符回退尝试，耗时与行长的平方成正比。这里按行
+    记录每两个字符出现的位置，只在这两个字符（或单个字符隔着空白）再次出现的位置
+    按正则的回溯顺序检查可能的重复单元。重复单元不跨行，但再次出现的位置可以在
+    隔着空白的下一行开头。
+    """
+    single = {match.start() for match in REPEATED_CHAR.finditer(content)}
+    parts = []
+    position = 0
+    start, length = 0, len(content)
+    while start < length:
+        eol = content.find('\n', start)
+        if eol < 0:
+            eol = length
+        end = eol
+        while end < length and content[end].isspace():
+            end += 1
+
+        occurrences = {}
+        for index in range(start, min(end + 1, length - 1)):
+            occurrences.setdefault(content[index:index + 2], []).append(index)
+
+        for index in range(max(start, position), eol):
+            if index < position:
+                continue
+            positions = occurrences[content[index:index + 2]] if index + 2 <= eol else ()
+            if (positions and positions[-1] >= index + 2) or index in single:
+                found = _repeat_at(content, index, eol, positions, index in single)
+                if found:
+                    parts.append(content[position:index])
+                    parts.append(found[0])
+                    position = found[1]
+        start = eol + 1
+
+    parts.append(content[position:])
+    return ''.join(parts)
+
+
+def clean_content(content):
+    """清理内容格式"""
+    # 移除重复的章节标题
+    lines = content.split('\n')
+    cleaned_lines = []
+    seen_titles = set()
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        # 检查是否是重复的章节标题（常见的古籍标题模式）
+        if TITLE_LINE.search(line):
+            if line in seen_titles:
+                continue
+            seen_titles.add(line)
+
+        cleaned_lines.append(line)
+
+    # 重新组合内容
+    content = '\n\n'.join(cleaned_lines)
+
+    # 移除其他重复内容（基于常见的重复模式）
+    content = remove_repeated_text(content)  # 移除完全重复的行
+
+    # 清理常见的无关内容
+    content = SITE_FOOTER.sub('', content)
+    content = FETCH_INFO.sub('', content)
+    content = SOURCE_LINK.sub('', content)
+
+    # 移除空行过多的地方
+    content = EXTRA_BLANK_LINES.sub('\n\n', content)
+
+    return content
+
+
+def build_chapter_data(chapter, content):
+    """清理章节正文，无有效内容时返回None"""
+    if content and len(content) > 100:  # 只保存有实际内容的章节
+        return {
+            'title': chapter['title'],
+            'url': chapter['url'],
+            'content': clean_content(content)
+        }
+    return None
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分阶段流水线
+各阶段在独立线程中运行，阶段之间用有界队列连接：下游处理不过来时
+上游会阻塞等待（背压），同时在途的数据量不会超过队列容量
+"""
+
+import queue
+import threading
+
+# 阶段结束标记
+_DONE = object()
+
+
+class Pipeline:
+    """有界队列连接的多阶段流水线
+
+    每个阶段是一个函数 func(value) -> value，返回 None 表示丢弃该条数据；
+    阶段抛出的异常会被打印并丢弃该条数据，不影响其他数据。
+    """
+
+    def __init__(self, queue_size=8):
+        self.queue_size = max(1, int(queue_size))
+        self.stages = []
+
+    def add_stage(self, name, func, workers=1):
+        """添加一个阶段，workers 为该阶段的并行线程数"""
+        self.stages.append({'name': name, 'func': func, 'workers': max(1, int(workers))})
+        return self
+
+    def run(self, items, sink):
+        """把 items 依次送入流水线，最后一个阶段的结果以 sink(index, value) 的形式交给调用线程"""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]), daemon=True)]
+
+        for position, stage in enumerate(self.stages):
+            inbox, outbox = queues[position], queues[position + 1]
+            # 同一阶段的最后一个线程退出时，向下游发送结束标记
+            remaining = {'count': stage['workers']}
+            lock = threading.Lock()
+            next_workers = self._workers_of(position + 1)
+            for _ in range(stage['workers']):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, inbox, outbox, remaining, lock, next_workers),
+                    daemon=True
+                ))
+
+        for thread in threads:
+            thread.start()
+
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                break
+            sink(*item)
+
+        for thread in threads:
+            thread.join()
+
+    def _workers_of(self, stage_index):
+        """某个阶段的线程数，超出最后一个阶段时为调用线程（1个）"""
+        if stage_index < len(self.stages):
+            return self.stages[stage_index]['workers']
+        return 1
+
+    def _feed(self, items, outbox):
+        for index, item in enumerate(items):
+            outbox.put((index, item))
+        for _ in range(self.stages[0]['workers']):
+            outbox.put(_DONE)
+
+    def _work(self, stage, inbox, outbox, remaining, lock, next_workers):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+
+            index, value = item
+            try:
+                result = stage['func'](value)
+            except Exception as e:
+                print(f"流水线阶段 {stage['name']} 处理失败: {e}")
+                continue
+            if result is not None:
+                outbox.put((index, result))
+
+        with lock:
+            remaining['count'] -= 1
+            last = remaining['count'] == 0
+        if last:
+            for _ in range(next_workers):
+                outbox.put(_DONE)
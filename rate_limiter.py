@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求限速器
+使用令牌桶控制请求速率，代替每次请求后固定的 time.sleep；
+SharedTokenBucket 把令牌保存在sqlite文件中，供同一台机器上的多个进程共用
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class TokenBucket:
+    """线程安全的令牌桶限速器
+
+    rate 为每秒补充的令牌数（支持小数，例如 0.5 表示每2秒一个请求），
+    burst 为桶容量，即空闲后允许连续发出的最大请求数。
+    rate <= 0 表示不限速。
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_delay(cls, delay, burst=1):
+        """按请求间隔（秒）创建限速器，兼容 REQUEST_DELAY 配置"""
+        rate = 1.0 / delay if delay > 0 else 0
+        return cls(rate, burst)
+
+    def _refill(self, now):
+        """按经过的时间补充令牌"""
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def acquire(self, tokens=1):
+        """获取令牌，令牌不足时阻塞等待，返回实际等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait_time = (tokens - self._tokens) / self.rate
+
+            time.sleep(wait_time)
+            waited += wait_time
+
+
+class SharedTokenBucket:
+    """跨进程共享的令牌桶
+
+    令牌数和上次补充时间保存在sqlite文件中，每次取令牌都在
+    BEGIN IMMEDIATE 事务中完成，由sqlite的文件锁保证多个进程之间互斥。
+    同一台机器上所有使用同一文件的进程共同遵守 rate / burst 限制，
+    因此各进程应配置相同的 rate 和 burst。
+    """
+
+    DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'shidianguji_rate_budget.sqlite3')
+
+    def __init__(self, rate, burst=1, path=None, name='shidianguji'):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.path = path or self.DEFAULT_PATH
+        self.name = name
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)'
+        )
+
+    def acquire(self, tokens=1):
+        """获取令牌，令牌不足时阻塞等待，返回实际等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                wait_time = self._try_acquire(tokens)
+            if wait_time <= 0:
+                return waited
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def _try_acquire(self, tokens):
+        """在一个写事务中补充并尝试扣减令牌，成功返回0，否则返回需要等待的秒数"""
+        # 进程之间共享，只能使用墙上时间
+        now = time.time()
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._db.execute('SELECT tokens, updated FROM buckets WHERE name = ?', (self.name,)).fetchone()
+            if row:
+                available = min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+            else:
+                available = self.burst
+
+            if available >= tokens:
+                available -= tokens
+                wait_time = 0.0
+            else:
+                wait_time = (tokens - available) / self.rate
+
+            self._db.execute(
+                'INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)',
+                (self.name, available, now)
+            )
+            self._db.execute('COMMIT')
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        return wait_time
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求容错
+提供带抖动的指数退避重试策略、熔断器、运行截止时间和对冲请求的延迟统计
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+
+class RetryPolicy:
+    """重试策略：指数退避 + 全抖动，429/503 时优先遵守 Retry-After"""
+
+    # 这些状态码通常是暂时性的，值得重试
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+    RETRY_AFTER_STATUS_CODES = {429, 503}
+
+    def __init__(self, max_retries=3, backoff_base=1.0, backoff_max=60.0):
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+
+    def is_retryable(self, response):
+        """判断响应是否需要重试"""
+        return response.status_code in self.RETRY_STATUS_CODES
+
+    def backoff(self, attempt):
+        """第 attempt 次重试前的等待时间（秒），在 [0, base * 2^attempt] 内随机"""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def retry_after(self, response):
+        """解析 Retry-After 头，支持秒数和HTTP日期两种格式，无法解析时返回None"""
+        if response is None or response.status_code not in self.RETRY_AFTER_STATUS_CODES:
+            return None
+
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_at.timestamp() - time.time())
+
+    def delay(self, attempt, response=None):
+        """计算下一次重试前的等待时间"""
+        retry_after = self.retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        return self.backoff(attempt)
+
+
+class CircuitBreaker:
+    """熔断器：最近的请求错误率过高时暂停所有请求一段时间
+
+    统计最近 window 个请求的结果，样本数不少于 min_requests 且错误率
+    达到 error_threshold 时熔断，所有请求等待 cooldown 秒。冷却结束后
+    进入半开状态，下一个请求成功则恢复，失败则再次熔断。
+    """
+
+    def __init__(self, window=20, error_threshold=0.5, min_requests=10, cooldown=60.0):
+        self.error_threshold = float(error_threshold)
+        self.min_requests = max(1, int(min_requests))
+        self.cooldown = float(cooldown)
+        self._results = deque(maxlen=max(1, int(window)))
+        self._open_until = 0.0
+        self._half_open = False
+        self._lock = threading.Lock()
+
+    def wait_if_open(self):
+        """熔断期间阻塞，直到冷却结束"""
+        while True:
+            with self._lock:
+                remaining = self._open_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def record(self, success):
+        """记录一次请求结果"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._open_until:
+                # 熔断前已发出的请求，结果不计入统计
+                return
+
+            if self._half_open:
+                # 冷却后的第一个请求决定是否恢复
+                self._half_open = False
+                if not success:
+                    self._trip(now, "冷却后请求仍然失败")
+                return
+
+            self._results.append(bool(success))
+            if len(self._results) < self.min_requests:
+                return
+
+            error_rate = self._results.count(False) / len(self._results)
+            if error_rate >= self.error_threshold:
+                self._trip(now, f"错误率 {error_rate:.0%} 过高")
+
+    def _trip(self, now, reason):
+        """进入熔断状态（调用方需持有锁）"""
+        print(f"{reason}，暂停请求 {self.cooldown:.0f} 秒")
+        self._open_until = now + self.cooldown
+        self._results.clear()
+        self._half_open = True
+
+
+class DeadlineExceeded(Exception):
+    """超过本次运行的截止时间"""
+
+
+class LatencyTracker:
+    """记录最近请求的耗时，用于计算对冲请求的触发阈值"""
+
+    def __init__(self, sample_size=100, min_samples=20):
+        self.min_samples = max(1, int(min_samples))
+        self._latencies = deque(maxlen=max(self.min_samples, int(sample_size)))
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, fraction):
+        """最近请求耗时的分位数（秒），样本不足时返回None"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+正文提取策略缓存
+同一本书的章节页面使用同一个模板，前几个章节确定有效的提取策略后，
+后续章节（以及之后的运行）直接使用该策略，提取不到内容时才重新探测
+"""
+
+import json
+import os
+import threading
+
+
+class StrategyCache:
+    """按书籍ID保存正文提取策略（见 parsing.extract_with_strategy）
+
+    学习阶段每个章节都完整探测，连续 learn_samples 个章节使用同一策略后
+    确定下来并写入JSON文件；确定的策略失效、重新探测得到其他策略时立即更新。
+    """
+
+    def __init__(self, path, book_id, learn_samples=3):
+        self.path = path
+        self.book_id = book_id
+        self.learn_samples = max(1, int(learn_samples))
+        self.reprobed = 0
+        self._samples = []
+        self._lock = threading.Lock()
+        self.strategy = self._load().get(book_id)
+        self.loaded = self.strategy is not None
+
+    def current(self):
+        """当前确定的策略，学习阶段返回None"""
+        return self.strategy
+
+    def record(self, used):
+        """记录一个章节实际使用的策略，没有提取到内容时传入None"""
+        if used is None:
+            return
+        with self._lock:
+            if self.strategy is None:
+                self._samples.append(used)
+                self._samples = self._samples[-self.learn_samples:]
+                if len(self._samples) == self.learn_samples and all(s == used for s in self._samples):
+                    self.strategy = used
+                    print(f"提取策略: 前 {self.learn_samples} 个章节都使用 {describe(used)}，后续章节直接使用")
+                    self._save()
+            elif used != self.strategy:
+                self.reprobed += 1
+                print(f"提取策略 {describe(self.strategy)} 已失效，改用 {describe(used)}")
+                self.strategy = used
+                self._save()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取提取策略缓存失败: {e}")
+            return {}
+
+    def _save(self):
+        """合并写入，保留其他书籍的策略（调用方需持有锁）"""
+        strategies = self._load()
+        strategies[self.book_id] = self.strategy
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(strategies, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"保存提取策略缓存失败: {e}")
+
+
+def describe(strategy):
+    """策略的简短说明，用于日志"""
+    if strategy.get('method') == 'block':
+        selector = strategy.get('tag') or ''
+        if strategy.get('class'):
+            selector += '.' + '.'.join(strategy['class'].split())
+        elif strategy.get('id'):
+            selector += '#' + strategy['id']
+        return f"内容区域 {selector}"
+    return {'payload': '内嵌数据', 'article': '<article>', 'page': '整页文字'}.get(
+        strategy.get('method'), str(strategy))
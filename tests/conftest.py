@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""pytest配置：项目模块都在仓库根目录，测试前加入导入路径"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""parsing 模块测试
+
+页面由 books/ 下已获取的markdown按站点页面结构合成（见 benchmark_parsers.synthesize_pages），
+包括 <article>、只有内容区域、内容区域前有同 class 短提示、<article> 之后有内嵌数据、
+GB18030编码等几种页面。
+
+正文清理以原来逐条执行正则的实现为基准，检查由 books/ 还原的章节正文和
+随机组合的文本（固定随机种子）。
+"""
+
+import glob
+import os
+import random
+import re
+
+import pytest
+from bs4 import UnicodeDammit
+
+import parsing
+from benchmark_parsers import read_book_chapters, stream_prefix, synthesize_pages
+
+BOOKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'books')
+PAGES = synthesize_pages(BOOKS_DIR)
+
+# 可选后端依赖缺失时跳过对应测试
+BACKENDS = [
+    'html.parser',
+    pytest.param('lxml', marks=pytest.mark.skipif(
+        parsing.resolve_parser('lxml') != 'lxml', reason='lxml 未安装')),
+    pytest.param('selectolax', marks=pytest.mark.skipif(
+        parsing.resolve_parser('selectolax') != 'selectolax', reason='selectolax 未安装')),
+]
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    """以 html.parser 完整探测的结果为基准"""
+    return [parsing.extract_with_strategy(page, name, 'html.parser') for name, page in PAGES]
+
+
+def test_pages_available():
+    """books/ 中有可用于合成页面的章节"""
+    assert PAGES
+
+
+@pytest.mark.parametrize('parser', BACKENDS)
+def test_backend_matches_html_parser(parser, baseline):
+    """各解析后端提取的正文与 html.parser 完全一致"""
+    for (name, page), (expected, _) in zip(PAGES, baseline):
+        assert parsing.extract_chapter_content(page, name, parser) == expected, name
+
+
+@pytest.mark.parametrize('parser', BACKENDS)
+def test_learned_strategy_matches_probe(parser):
+    """按完整探测学到的策略重新提取，结果与完整探测相同"""
+    for name, page in PAGES:
+        expected, strategy = parsing.extract_with_strategy(page, name, parser)
+        actual, _ = parsing.extract_with_strategy(page, name, parser, strategy=strategy)
+        assert actual == expected, (name, strategy)
+
+
+@pytest.mark.parametrize('parser', BACKENDS)
+def test_stream_prefix_matches_probe(parser):
+    """模拟流式下载提前停止（学习阶段和学到策略后），提取结果与完整页面相同"""
+    for name, page in PAGES:
+        expected, strategy = parsing.extract_with_strategy(page, name, parser)
+        for known in (None, strategy):
+            actual, _ = parsing.extract_with_strategy(stream_prefix(page, known), name, parser, strategy=known)
+            assert actual == expected, (name, known)
+
+
+def test_block_strategy_picks_largest_element():
+    """同 class 的短提示在正文之前时，按策略提取仍选中正文"""
+    notice_pages = [(name, page) for name, page in PAGES if name.endswith('[notice]')]
+    assert notice_pages
+    for name, page in notice_pages:
+        content, strategy = parsing.extract_with_strategy(page, name)
+        assert strategy['method'] == 'block'
+        assert '本页说明' not in content
+        assert parsing.extract_with_strategy(page, name, strategy=strategy)[0] == content
+
+
+def test_decode_html_matches_unicodedammit():
+    """按声明编码解码与BeautifulSoup的编码检测结果相同"""
+    for name, page in PAGES:
+        assert parsing.decode_html(page) == UnicodeDammit(page, is_html=True).unicode_markup, name
+
+
+def test_decode_html_gbk_declared_as_gb18030():
+    """声明为GB2312的页面按GB18030解码，不丢失超出GB2312的生僻字"""
+    text = '<html><head><meta charset="gb2312"></head><body>䶮龘皇极经世</body></html>'
+    assert parsing.decode_html(text.encode('gb18030')) == text
+
+
+def test_decode_html_truncated_utf8():
+    """流式下载截断在多字节字符中间时丢弃不完整的字符"""
+    page = '<html><body>皇极经世</body></html>'.encode('utf-8')
+    assert parsing.decode_html(page[:16], 'utf-8', final=False) == '<html><body>皇'
+
+
+def legacy_finish_chapter_content(content, title):
+    """原实现：parsing._finish_chapter_content"""
+    if len(content.strip()) < 10:
+        return ""
+
+    content = re.sub(r'识典古籍.*?版权所有', '', content, flags=re.DOTALL)
+    content = re.sub(r'登录后阅读更方便', '', content)
+    content = re.sub(r'书库', '', content)
+    content = re.sub(r'下一篇.*?$', '', content, flags=re.MULTILINE)
+    content = re.sub(r'上一章.*?$', '', content, flags=re.MULTILINE)
+    content = re.sub(r'目录', '', content)
+
+    lines = [line.strip() for line in content.split('\n') if line.strip()]
+    return '\n\n'.join(lines)
+
+
+def legacy_clean_content(content):
+    """原实现：parsing.clean_content"""
+    lines = content.split('\n')
+    cleaned_lines = []
+    seen_titles = set()
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        title_patterns = [
+            r'^.*卷.*[上下中]$',
+            r'^.*卷.*第.*$',
+            r'^.*章.*$',
+            r'^.*节.*$',
+            r'^.*篇.*$',
+            r'^.*之.*$',
+            r'^.*解.*$',
+            r'^.*经.*$',
+            r'^.*论.*$'
+        ]
+
+        is_title = False
+        for pattern in title_patterns:
+            if re.match(pattern, line):
+                is_title = True
+                break
+
+        if is_title:
+            if line in seen_titles:
+                continue
+            seen_titles.add(line)
+
+        cleaned_lines.append(line)
+
+    content = '\n\n'.join(cleaned_lines)
+    content = re.sub(r'(.+)\s*\1+', r'\1', content)
+    content = re.sub(r'识典古籍.*?版权所有', '', content, flags=re.DOTALL)
+    content = re.sub(r'获取时间.*?获取方式', '', content, flags=re.DOTALL)
+    content = re.sub(r'来源链接.*?$', '', content, flags=re.MULTILINE)
+    content = re.sub(r'\n\s*\n\s*\n', '\n\n', content)
+    return content
+
+
+def book_texts(books_dir=BOOKS_DIR):
+    """还原提取出的章节正文（清理前），返回 [(标题, 文本)]"""
+    texts = []
+    for path in sorted(glob.glob(os.path.join(books_dir, '*.md'))):
+        for title, paragraphs in read_book_chapters(path):
+            lines = ['首页 书库', '登录后阅读更方便', '目录', title, title] + paragraphs
+            lines += ['上一章 下一篇', '识典古籍 © 北京字节跳动科技有限公司', '版权所有']
+            texts.append((title, '\n'.join(lines)))
+    return texts
+
+
+def random_texts(count, seed=20240924):
+    """随机组合的文本，覆盖重复文字、标题行和站点文字相互拼接等情况，返回 [(标题, 文本)]"""
+    rng = random.Random(seed)
+    pieces = list('之而也子孙卷上下中第章节篇解经论观物以元会运世') + [
+        ' ', '　', '\t', '\n', '\n\n', '识典古籍', '版权所有', '登录后', '阅读更方便', '书', '库', '目', '录',
+        '上一章', '下一篇', '获取时间', '获取方式', '来源链接', '皇极经世卷第一', '观物篇之五十一',
+    ]
+    texts = []
+    for index in range(count):
+        words = [rng.choice(pieces) for _ in range(rng.randint(0, 40))]
+        texts.append((f"随机{index}", '皇极经世观物内篇之一' + ''.join(words)))
+    return texts
+
+
+CLEANING_CORPORA = {
+    'books': book_texts,
+    'random': lambda: random_texts(20000),
+}
+
+
+@pytest.mark.parametrize('corpus', sorted(CLEANING_CORPORA))
+def test_cleaning_matches_legacy(corpus):
+    """预编译的清理规则与原实现结果完全一致"""
+    texts = CLEANING_CORPORA[corpus]()
+    assert texts
+    for title, text in texts:
+        assert parsing._finish_chapter_content(text, title) == legacy_finish_chapter_content(text, title), title
+        assert parsing.clean_content(text) == legacy_clean_content(text), title
+
+
+@pytest.mark.parametrize('alphabet', ['ab \n', 'a b\n\t', 'aab  \n\n', 'abc \n', '之而 　\n', '之而也子孙卷上第章 　\n\t一二'])
+def test_remove_repeated_text_matches_regex(alphabet):
+    """小字母表随机文本上与 re.sub(r'(.+)\\s*\\1+', r'\\1', ...) 结果相同"""
+    rng = random.Random(alphabet)
+    for _ in range(10000):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 24)))
+        assert parsing.remove_repeated_text(text) == re.sub(r'(.+)\s*\1+', r'\1', text), repr(text)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP传输层
+ShidiangujiFetcher 通过 transport.get() 发出请求，可以在 requests 连接池
+和基于 httpx 的 HTTP/2 多路复用客户端之间切换；两者都返回 requests.Response，
+并在 response.wire_bytes 中记录网络上实际传输的（压缩后的）响应体字节数，
+无法统计时为None
+"""
+
+import asyncio
+import threading
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+def accept_encoding():
+    """可以解码的内容编码：总是支持 gzip/deflate，安装了 brotli 时加上 br"""
+    encodings = ['gzip', 'deflate']
+    try:
+        import brotli  # noqa: F401
+        encodings.append('br')
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+            encodings.append('br')
+        except ImportError:
+            pass
+    return ', '.join(encodings)
+
+
+class TransferStats:
+    """统计网络传输字节数（压缩后）和解码后的字节数
+
+    total 统计所有请求（包括目录页、重试和对冲请求），
+    chapters 按URL记录每个章节最终采用的响应。
+    网络字节未知的响应计入 unknown，其解码后字节不参与压缩比例的计算。
+    """
+
+    def __init__(self):
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self.requests = 0
+        self.unknown = 0
+        self.unknown_decoded_bytes = 0
+        self.chapters = {}
+        self._lock = threading.Lock()
+
+    def record(self, response, size=None):
+        """记录一次网络响应，size 为实际读取的解码后字节数（流式读取时不是完整页面）"""
+        decoded = len(response.content) if size is None else size
+        wire = getattr(response, 'wire_bytes', 0)
+        with self._lock:
+            self.requests += 1
+            self.decoded_bytes += decoded
+            if wire is None:
+                self.unknown += 1
+                self.unknown_decoded_bytes += decoded
+            else:
+                self.wire_bytes += wire
+
+    def saved_ratio(self):
+        """压缩节省的比例，只计算网络字节已知的响应"""
+        known_decoded = self.decoded_bytes - self.unknown_decoded_bytes
+        return 1 - self.wire_bytes / known_decoded if known_decoded else 0
+
+    def record_chapter(self, url, response, size=None):
+        """记录章节页面的字节数，来自缓存的页面网络字节为0"""
+        decoded = len(response.content) if size is None else size
+        with self._lock:
+            self.chapters[url] = (getattr(response, 'wire_bytes', 0), decoded)
+
+    def chapter_totals(self):
+        """章节页面的 (网络字节, 解码字节) 合计，网络字节未知的章节不计入网络字节"""
+        with self._lock:
+            values = list(self.chapters.values())
+        return sum(wire or 0 for wire, _ in values), sum(decoded for _, decoded in values)
+
+    def largest_chapters(self, count=5):
+        """网络字节最多的章节，便于发现异常臃肿的页面"""
+        with self._lock:
+            items = list(self.chapters.items())
+        items.sort(key=lambda item: -1 if item[1][0] is None else item[1][0], reverse=True)
+        return items[:count]
+
+
+class PageTooLarge(requests.RequestException):
+    """页面超过允许的最大大小"""
+
+
+def count_wire_bytes(response):
+    """统计 urllib3 响应进入解码器之前（压缩后）的字节数，累加到 response.wire_bytes
+
+    urllib3 2.x 读取 Transfer-Encoding: chunked 的响应时不更新 raw.tell()，
+    这里包装解码函数，chunked 和普通响应都能统计。必须在读取响应体之前调用。
+    """
+    response.wire_bytes = 0
+    decode = getattr(response.raw, '_decode', None)
+    if decode is None:
+        return
+
+    def counting_decode(data, *args, **kwargs):
+        response.wire_bytes += len(data)
+        return decode(data, *args, **kwargs)
+
+    response.raw._decode = counting_decode
+
+
+def check_wire_bytes(response, size):
+    """响应体不为空却没有统计到网络字节时改用 raw.tell()，仍为0则记为未知（None）"""
+    if getattr(response, 'wire_bytes', 0) == 0 and size:
+        try:
+            response.wire_bytes = response.raw.tell() or None
+        except Exception:
+            response.wire_bytes = None
+
+
+def read_streaming(response, stop=None, max_bytes=0, chunk_size=16384):
+    """逐块读取 stream=True 的响应，返回 (已读取的内容, 是否提前停止)
+
+    每读到一块就调用 stop(chunk)，返回True时不再读取剩余内容并关闭连接；
+    解码后超过 max_bytes（0表示不限制）时抛出 PageTooLarge。
+    读取结束后 response.wire_bytes 为实际从网络读取的字节数（见 count_wire_bytes）。
+    """
+    chunks = []
+    size = 0
+    stopped = False
+    try:
+        for chunk in response.iter_content(chunk_size):
+            chunks.append(chunk)
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise PageTooLarge(f"页面超过 {max_bytes} 字节上限: {response.url}")
+            if stop is not None and stop(chunk):
+                stopped = True
+                break
+    finally:
+        # HTTP/2传输的响应已在 get() 中记录了网络字节数
+        check_wire_bytes(response, size)
+        response.close()
+    return b''.join(chunks), stopped
+
+
+class RequestsTransport:
+    """默认传输：requests.Session（HTTP/1.1 连接池）"""
+
+    name = 'requests'
+
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, url, stream=False, **kwargs):
+        # 总是以流式发出请求，在读取响应体之前挂上网络字节统计；
+        # 非流式请求随后读取完整响应体，与 requests 自身的做法相同
+        response = self.session.get(url, stream=True, **kwargs)
+        count_wire_bytes(response)
+        if not stream:
+            check_wire_bytes(response, len(response.content))
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+class Http2Transport:
+    """HTTP/2传输：同一主机的并发请求在一个连接上多路复用
+
+    依赖可选包 httpx[http2]。https 站点通过ALPN协商HTTP/2，
+    http1=False 时对明文 http 直接使用HTTP/2（h2c，仅用于本地测试服务器）。
+    httpx 的同步客户端在多线程共享HTTP/2连接时并不安全，因此这里在一个
+    后台事件循环中运行 AsyncClient，各工作线程把请求提交到该循环并等待结果。
+    """
+
+    name = 'http2'
+
+    def __init__(self, headers=None, max_connections=10, http1=True):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("HTTP/2 传输需要安装 httpx[http2]: pip install 'httpx[http2]'")
+
+        self._httpx = httpx
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        self.client = httpx.AsyncClient(
+            http1=http1,
+            http2=True,
+            headers=headers,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    def get(self, url, headers=None, timeout=None, **kwargs):
+        """发送GET请求，参数和异常都与 requests 保持一致"""
+        httpx = self._httpx
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+
+        request = self.client.get(url, headers=headers, timeout=timeout)
+        try:
+            response = asyncio.run_coroutine_threadsafe(request, self._loop).result()
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e))
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        return self._to_requests_response(response)
+
+    @staticmethod
+    def _to_requests_response(response):
+        """把 httpx.Response 转换为 requests.Response，调用方无需区分传输方式"""
+        converted = requests.Response()
+        converted.status_code = response.status_code
+        converted.reason = response.reason_phrase
+        converted.url = str(response.url)
+        converted.headers = CaseInsensitiveDict(response.headers)
+        converted._content = response.content
+        converted._content_consumed = True
+        converted.encoding = response.charset_encoding
+        converted.elapsed = response.elapsed
+        converted.http_version = response.http_version
+        converted.wire_bytes = response.num_bytes_downloaded
+        return converted
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def create_transport(name, session, max_connections=10):
+    """按名称创建传输，HTTP/2依赖缺失时回退到 requests"""
+    if name == 'http2':
+        try:
+            return Http2Transport(dict(session.headers), max_connections)
+        except ImportError as e:
+            print(f"{e}，改用 requests 传输")
+    return RequestsTransport(session)